@@ -0,0 +1,74 @@
+from typing import Iterable
+
+from sqlalchemy import Boolean, Date, Integer, bindparam, cast, func, inspect, select
+from sqlalchemy.dialects import sqlite
+from sqlmodel import Session
+
+from models import AttendanceLog, AttendanceSummary
+
+
+def dialect_insert(session: Session, model):
+    # Core insert against the table: ON CONFLICT needs the dialect construct,
+    # and rows are plain dicts rather than ORM objects
+    if session.get_bind().dialect.name == "postgresql":
+        # Only loaded on PostgreSQL; it adds noticeably to worker startup
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert(model.__table__)
+    return sqlite.insert(model.__table__)
+
+
+# Applies attendance marks (dicts with student_id, course_id, session_date
+# and present) to the running summary inside the caller's transaction. Each
+# delta is computed against the log row the mark is about to replace, so a
+# re-marked session moves present_count without growing total_count. Must
+# run before the marks themselves are upserted.
+def record_attendance(session: Session, rows: Iterable[dict]):
+    rows = [
+        {key: row[key] for key in ("student_id", "course_id", "session_date", "present")}
+        for row in rows
+    ]
+    if not rows:
+        return
+
+    replaced = select(
+        bindparam("student_id", type_=Integer),
+        bindparam("course_id", type_=Integer),
+        cast(bindparam("present", type_=Boolean), Integer)
+        - func.coalesce(func.max(cast(AttendanceLog.present, Integer)), 0),
+        1 - func.count(AttendanceLog.id),
+    ).where(
+        AttendanceLog.student_id == bindparam("student_id"),
+        AttendanceLog.course_id == bindparam("course_id"),
+        AttendanceLog.session_date == bindparam("session_date", type_=Date),
+    )
+    stmt = dialect_insert(session, AttendanceSummary).from_select(
+        ["student_id", "course_id", "present_count", "total_count"], replaced
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AttendanceSummary.student_id, AttendanceSummary.course_id],
+        set_={
+            "present_count": AttendanceSummary.present_count + stmt.excluded.present_count,
+            "total_count": AttendanceSummary.total_count + stmt.excluded.total_count,
+        },
+    )
+    session.execute(stmt, rows)
+
+
+# log may be a union over the archived partitions as well as the hot table
+def rebuild_attendance_summary(session: Session, log=AttendanceLog):
+    session.execute(AttendanceSummary.__table__.delete())
+    session.execute(
+        AttendanceSummary.__table__.insert().from_select(
+            ["student_id", "course_id", "present_count", "total_count"],
+            select(
+                log.student_id,
+                log.course_id,
+                func.sum(cast(log.present, Integer)),
+                func.count(),
+            ).group_by(log.student_id, log.course_id),
+        )
+    )
+
+
+def has_attendance_summary(engine) -> bool:
+    return inspect(engine).has_table(AttendanceSummary.__tablename__)
@@ -0,0 +1,207 @@
+import itertools
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import or_, select
+from sqlmodel import Session
+
+from archive import attendance_log_source, term_bounds
+from config import settings
+from models import AttendanceLog, Course
+
+# Marks re-read on every refresh, so a transaction that committed after
+# the previous refresh started is not missed. Re-reading a mark is harmless.
+REFRESH_OVERLAP = timedelta(seconds=30)
+LOAD_CHUNK_ROWS = 50_000
+
+
+def records(columns: dict) -> list[dict]:
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*(columns[name].tolist() for name in names))]
+
+
+def rates(present: np.ndarray, total: np.ndarray) -> np.ndarray:
+    return np.divide(present, total, out=np.zeros(total.shape), where=total > 0)
+
+
+class AttendanceMatrix:
+    # One term's attendance as dense student × course arrays of present and
+    # total counts; rows and columns follow the sorted student_ids and
+    # course_ids. The id and present flag of every mark counted are kept
+    # (sorted by id), so a mark that is read again only applies the change
+    # in present, which is what makes overlapping refreshes safe.
+
+    def __init__(self, term: str):
+        self.term = term
+        self.start, self.end = term_bounds(term)
+        self.student_ids = np.empty(0, np.int64)
+        self.course_ids = np.empty(0, np.int64)
+        self.course_departments = np.empty(0, np.int64)
+        self.present = np.zeros((0, 0), np.int32)
+        self.total = np.zeros((0, 0), np.int32)
+        self.log_ids = np.empty(0, np.int64)
+        self.log_present = np.empty(0, np.int8)
+        self.last_id = 0
+        self.since: str | None = None
+        self.refreshed_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def refresh(self, session: Session, max_age: float = 0.0):
+        with self._lock:
+            if time.monotonic() - self.refreshed_at < max_age:
+                return
+            refreshed_at = time.monotonic()
+            since = str(datetime.now() - REFRESH_OVERLAP)
+            if self.since is None:
+                log = attendance_log_source(self.start, self.end)
+                statement = select(log.id, log.student_id, log.course_id, log.present)
+            else:
+                # Archived terms take no writes, so only the hot table changes
+                log = AttendanceLog
+                statement = select(log.id, log.student_id, log.course_id, log.present).where(
+                    or_(log.id > self.last_id, log.updated_at >= self.since)
+                )
+            statement = statement.where(log.session_date >= self.start, log.session_date < self.end)
+            # Core rows from the session's connection skip the ORM result layer
+            result = session.connection().execute(statement.execution_options(yield_per=LOAD_CHUNK_ROWS))
+            for chunk in result.partitions():
+                # Flattened straight into the array: building it from Row
+                # objects is two orders of magnitude slower
+                marks = np.fromiter(itertools.chain.from_iterable(chunk), np.int64, count=4 * len(chunk))
+                self._apply(session, marks.reshape(-1, 4))
+            self.since, self.refreshed_at = since, refreshed_at
+
+    def _grow(self, session: Session, student_ids: np.ndarray, course_ids: np.ndarray):
+        students = np.union1d(self.student_ids, student_ids)
+        courses = np.union1d(self.course_ids, course_ids)
+        if len(students) == len(self.student_ids) and len(courses) == len(self.course_ids):
+            return
+        rows = np.searchsorted(students, self.student_ids)
+        columns = np.searchsorted(courses, self.course_ids)
+        for name in ("present", "total"):
+            grown = np.zeros((len(students), len(courses)), np.int32)
+            grown[np.ix_(rows, columns)] = getattr(self, name)
+            setattr(self, name, grown)
+        if len(courses) != len(self.course_ids):
+            # One row per course, read whole: far fewer than the marks
+            departments = dict(session.execute(select(Course.id, Course.department_id)).all())
+            self.course_departments = np.array(
+                [departments.get(course, 0) for course in courses.tolist()], np.int64
+            )
+        self.student_ids, self.course_ids = students, courses
+
+    def _apply(self, session: Session, marks: np.ndarray):
+        if not len(marks):
+            return
+        marks = marks[np.argsort(marks[:, 0])]
+        ids, student_ids, course_ids, present = marks.T
+        self._grow(session, student_ids, course_ids)
+
+        found = np.searchsorted(self.log_ids, ids)
+        known = found < len(self.log_ids)
+        known[known] = self.log_ids[found[known]] == ids[known]
+        present_delta = present.astype(np.int32)
+        present_delta[known] -= self.log_present[found[known]]
+        self.log_present[found[known]] = present[known]
+
+        new = ~known
+        if new.any():
+            log_ids = np.concatenate([self.log_ids, ids[new]])
+            log_present = np.concatenate([self.log_present, present[new].astype(np.int8)])
+            # New marks usually all follow the last one loaded
+            if len(self.log_ids) and ids[new][0] < self.log_ids[-1]:
+                order = np.argsort(log_ids, kind="stable")
+                log_ids, log_present = log_ids[order], log_present[order]
+            self.log_ids, self.log_present = log_ids, log_present
+            self.last_id = max(self.last_id, int(ids[-1]))
+
+        cells = (np.searchsorted(self.student_ids, student_ids), np.searchsorted(self.course_ids, course_ids))
+        np.add.at(self.present, cells, present_delta)
+        np.add.at(self.total, cells, new.astype(np.int32))
+
+    def below_threshold(self, threshold: float, min_sessions: int, limit: int) -> list[dict]:
+        with self._lock:
+            rate = rates(self.present, self.total)
+            rows, columns = np.nonzero((self.total >= max(min_sessions, 1)) & (rate < threshold))
+            order = np.lexsort((self.course_ids[columns], self.student_ids[rows], rate[rows, columns]))[:limit]
+            rows, columns = rows[order], columns[order]
+            return records({
+                "student_id": self.student_ids[rows],
+                "course_id": self.course_ids[columns],
+                "present_count": self.present[rows, columns],
+                "total_count": self.total[rows, columns],
+                "attendance_rate": rate[rows, columns],
+            })
+
+    def ranking(self, by: str, descending: bool, min_sessions: int, limit: int) -> list[dict]:
+        with self._lock:
+            axis = 1 if by == "student" else 0
+            ids = self.student_ids if by == "student" else self.course_ids
+            present, total = self.present.sum(axis=axis), self.total.sum(axis=axis)
+            rate = rates(present, total)
+            ranked = np.flatnonzero(total >= max(min_sessions, 1))
+            order = np.lexsort((ids[ranked], -rate[ranked] if descending else rate[ranked]))[:limit]
+            ranked = ranked[order]
+            return records({
+                "id": ids[ranked],
+                "present_count": present[ranked],
+                "total_count": total[ranked],
+                "attendance_rate": rate[ranked],
+            })
+
+    def department_rollup(self, threshold: float) -> list[dict]:
+        with self._lock:
+            departments, column_department = np.unique(self.course_departments, return_inverse=True)
+            # course -> department membership, as a (courses × departments) 0/1 matrix
+            membership = np.zeros((len(self.course_ids), len(departments)), np.int64)
+            membership[np.arange(len(self.course_ids)), column_department] = 1
+            present = self.present @ membership
+            total = self.total @ membership
+            student_rate = rates(present, total)
+            return records({
+                "department_id": departments,
+                "courses": membership.sum(axis=0),
+                "students": (total > 0).sum(axis=0),
+                "students_below_threshold": ((total > 0) & (student_rate < threshold)).sum(axis=0),
+                "present_count": present.sum(axis=0),
+                "total_count": total.sum(axis=0),
+                "attendance_rate": rates(present.sum(axis=0), total.sum(axis=0)),
+            })
+
+
+class AttendanceMatrices:
+    # Matrices per engine and term, built on first use and refreshed from the
+    # log at most every refresh_seconds. Only the max_terms most recently
+    # asked for stay in memory.
+
+    def __init__(self, refresh_seconds: float, max_terms: int):
+        self.refresh_seconds = refresh_seconds
+        self.max_terms = max_terms
+        self._matrices = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, session: Session, term: str) -> AttendanceMatrix:
+        with self._lock:
+            terms = self._matrices.setdefault(session.get_bind(), OrderedDict())
+            matrix = terms.get(term)
+            if matrix is None:
+                matrix = terms[term] = AttendanceMatrix(term)
+            terms.move_to_end(term)
+            while len(terms) > self.max_terms:
+                terms.popitem(last=False)
+        matrix.refresh(session, self.refresh_seconds)
+        return matrix
+
+    def clear(self):
+        with self._lock:
+            self._matrices.clear()
+
+
+attendance_matrices = AttendanceMatrices(
+    refresh_seconds=settings.analytics_refresh_seconds,
+    max_terms=settings.analytics_max_terms,
+)
@@ -0,0 +1,308 @@
+"""Semester partitioning for attendance logs.
+
+The attendancelog table holds the hot, current terms. Finished terms are
+moved into one SQLite file per academic year under ``ARCHIVE_DIR``
+(``attendance_2025.db`` with tables ``attendancelog_spring`` and so on),
+which every connection attaches read-only. Reads that filter on session
+date or term only touch the partitions that overlap the filter.
+
+    python archive.py list
+    python archive.py archive 2025-spring --vacuum
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import Column, Index, MetaData, Table, and_, create_engine, event, false, not_, select, union_all
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import aliased
+
+from config import settings
+from models import AttendanceLog
+
+# Each term runs from its first month until the next term starts
+TERM_STARTS = (("spring", 1), ("summer", 6), ("fall", 8))
+TERM_PATTERN = r"^\d{4}-(spring|summer|fall)$"
+
+ARCHIVE_COLUMNS = [column.name for column in AttendanceLog.__table__.columns]
+
+
+def term_of(day: date) -> str:
+    for name, month in reversed(TERM_STARTS):
+        if day.month >= month:
+            return f"{day.year}-{name}"
+
+
+def term_bounds(term: str) -> tuple[date, date]:
+    year, name = term.split("-")
+    year = int(year)
+    names = [term_name for term_name, _ in TERM_STARTS]
+    index = names.index(name)
+    start = date(year, TERM_STARTS[index][1], 1)
+    if index + 1 < len(TERM_STARTS):
+        return start, date(year, TERM_STARTS[index + 1][1], 1)
+    return start, date(year + 1, TERM_STARTS[0][1], 1)
+
+
+def archive_schema(term: str) -> str:
+    return f"archive_{term.split('-')[0]}"
+
+
+def archive_table_name(term: str) -> str:
+    return f"attendancelog_{term.split('-')[1]}"
+
+
+@lru_cache
+def archive_table(term: str, schema: Optional[str] = None) -> Table:
+    table = Table(
+        archive_table_name(term),
+        MetaData(),
+        *(Column(column.name, column.type, primary_key=column.primary_key)
+          for column in AttendanceLog.__table__.columns),
+        schema=schema,
+    )
+    name = archive_table_name(term)
+    Index(f"ix_{name}_updated_at_id", table.c.updated_at, table.c.id)
+    Index(f"ix_{name}_student_id", table.c.student_id, table.c.id)
+    Index(f"ix_{name}_course_id", table.c.course_id, table.c.id)
+    Index(f"ix_{name}_course_student_present", table.c.course_id, table.c.student_id, table.c.present)
+    return table
+
+
+class ArchiveRegistry:
+    # Tracks which terms have been archived, by scanning ARCHIVE_DIR at most
+    # once per refresh_interval. version changes whenever the set of archive
+    # files or their contents change, so connections know to re-attach.
+
+    def __init__(self, directory, refresh_interval: float = 1.0):
+        self.directory = Path(directory)
+        self.refresh_interval = refresh_interval
+        self.files: dict[str, Path] = {}
+        self.terms: dict[str, tuple[date, date]] = {}
+        self.version = 0
+        self._signature = None
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.refresh_interval:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                entries = sorted(
+                    (entry.name, entry.stat().st_mtime_ns)
+                    for entry in os.scandir(self.directory)
+                    if entry.name.startswith("attendance_") and entry.name.endswith(".db")
+                )
+            except FileNotFoundError:
+                entries = []
+            if entries == self._signature:
+                return
+            files, terms = {}, {}
+            for name, _ in entries:
+                path = self.directory / name
+                year = name.removeprefix("attendance_").removesuffix(".db")
+                if not year.isdigit():
+                    continue
+                files[f"archive_{year}"] = path
+                for term in self._read_terms(path, year):
+                    terms[term] = term_bounds(term)
+            self.files, self.terms = files, dict(sorted(terms.items(), key=lambda item: item[1]))
+            self._signature = entries
+            self.version += 1
+
+    @staticmethod
+    def _read_terms(path: Path, year: str) -> list[str]:
+        connection = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            names = connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'attendancelog_%'"
+            ).fetchall()
+        finally:
+            connection.close()
+        known = {term_name for term_name, _ in TERM_STARTS}
+        return [
+            f"{year}-{name.removeprefix('attendancelog_')}"
+            for (name,) in names
+            if name.removeprefix("attendancelog_") in known
+        ]
+
+    def archived_term(self, day: date) -> Optional[str]:
+        self.refresh()
+        term = term_of(day)
+        return term if term in self.terms else None
+
+    def partitions(self, start: Optional[date], end: Optional[date]) -> tuple[bool, tuple[str, ...]]:
+        # Archived terms overlapping [start, end), and whether any of the
+        # range falls outside them and so needs the hot table
+        self.refresh()
+        terms = tuple(
+            term for term, (term_start, term_end) in self.terms.items()
+            if (end is None or term_start < end) and (start is None or term_end > start)
+        )
+        include_hot = True
+        if terms and start is not None and end is not None:
+            covered = start
+            for term in terms:
+                term_start, term_end = self.terms[term]
+                if term_start > covered:
+                    break
+                covered = max(covered, term_end)
+            include_hot = covered < end
+        return include_hot, terms
+
+
+archives = ArchiveRegistry(settings.archive_dir)
+
+
+def attach_archives(sync_engine, registry: ArchiveRegistry = archives):
+    # Pooled connections outlive archival runs, so attachments are brought up
+    # to date on checkout rather than only when a connection is opened
+    @event.listens_for(sync_engine, "checkout")
+    def sync_archive_attachments(dbapi_connection, connection_record, connection_proxy):
+        registry.refresh()
+        if connection_record.info.get("archive_version") == registry.version:
+            return
+        attached = connection_record.info.setdefault("archive_files", {})
+        cursor = dbapi_connection.cursor()
+        for schema in [schema for schema in attached if registry.files.get(schema) != attached[schema]]:
+            cursor.execute(f"DETACH DATABASE {schema}")
+            del attached[schema]
+        for schema, path in registry.files.items():
+            if schema not in attached:
+                cursor.execute(f"ATTACH DATABASE ? AS {schema}", (f"{path.resolve().as_uri()}?mode=ro",))
+                attached[schema] = path
+        cursor.close()
+        connection_record.info["archive_version"] = registry.version
+
+
+@lru_cache(maxsize=64)
+def partition_source(include_hot: bool, terms: tuple[str, ...]):
+    # Stable per partition set, so the serialization plans cached per entity
+    # are reused across requests
+    if not terms:
+        return AttendanceLog
+    # The hot arm always comes first: the union's columns correspond to the
+    # attendancelog table through it, which is what lets the relationships
+    # and loader options on the alias join as usual. When the range lies
+    # wholly inside archived terms it is reduced to WHERE false.
+    hot = select(*(getattr(AttendanceLog, name) for name in ARCHIVE_COLUMNS))
+    if include_hot:
+        # Rows of an archived term may linger in the hot table while an
+        # archival run is committing; the archive copy is authoritative
+        hot = hot.where(*(
+            not_(and_(AttendanceLog.session_date >= start, AttendanceLog.session_date < end))
+            for start, end in map(term_bounds, terms)
+        ))
+    else:
+        hot = hot.where(false())
+    arms = [
+        select(*(table.c[name] for name in ARCHIVE_COLUMNS))
+        for table in (archive_table(term, archive_schema(term)) for term in terms)
+    ]
+    return aliased(AttendanceLog, union_all(hot, *arms).subquery("attendancelog_partitions"))
+
+
+def attendance_log_source(start: Optional[date] = None, end: Optional[date] = None,
+                          registry: ArchiveRegistry = archives):
+    return partition_source(*registry.partitions(start, end))
+
+
+def archive_term(database: str, term: str, directory=None) -> int:
+    start, end = term_bounds(term)
+    if end > date.today():
+        raise ValueError(f"{term} has not finished yet")
+    directory = Path(directory or settings.archive_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"attendance_{term.split('-')[0]}.db"
+
+    archive_engine = create_engine(f"sqlite:///{path}")
+    archive_table(term).metadata.create_all(archive_engine)
+    archive_engine.dispose()
+
+    connection = sqlite3.connect(database, isolation_level=None)
+    try:
+        connection.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms:d}")
+        bounds = (start.isoformat(), end.isoformat())
+        # Without AUTOINCREMENT SQLite reuses the largest rowid once it is
+        # deleted, which would hand out ids that now live in the archive
+        autoincrement = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'attendancelog' AND sql LIKE '%AUTOINCREMENT%'"
+        ).fetchone()
+        newest_in_term = connection.execute(
+            "SELECT 1 FROM attendancelog WHERE id = (SELECT max(id) FROM attendancelog)"
+            " AND session_date >= ? AND session_date < ?",
+            bounds,
+        ).fetchone()
+        if newest_in_term and not autoincrement:
+            raise ValueError(f"{term} holds the newest attendance row; archive it once a later term has marks")
+
+        connection.execute("ATTACH DATABASE ? AS archive_build", (str(path),))
+        columns = ", ".join(ARCHIVE_COLUMNS)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            moved = connection.execute(
+                f"INSERT INTO archive_build.{archive_table_name(term)} ({columns})"
+                f" SELECT {columns} FROM main.attendancelog"
+                " WHERE session_date >= ? AND session_date < ?",
+                bounds,
+            ).rowcount
+            connection.execute(
+                "DELETE FROM main.attendancelog WHERE session_date >= ? AND session_date < ?", bounds
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("DETACH DATABASE archive_build")
+    finally:
+        connection.close()
+    return moved
+
+
+def vacuum(database: str):
+    connection = sqlite3.connect(database, isolation_level=None)
+    try:
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default=settings.database_url)
+    parser.add_argument("--archive-dir", default=settings.archive_dir)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show archived terms")
+    archive = commands.add_parser("archive", help="move a finished term out of the hot table")
+    archive.add_argument("term", help="e.g. 2025-spring")
+    archive.add_argument("--vacuum", action="store_true", help="reclaim the space the term used")
+    args = parser.parse_args()
+
+    url = make_url(args.database)
+    if url.get_backend_name() != "sqlite" or not url.database:
+        parser.error("archival needs a SQLite database file")
+
+    if args.command == "list":
+        registry = ArchiveRegistry(args.archive_dir)
+        registry.refresh(force=True)
+        for term, (start, end) in registry.terms.items():
+            print(f"{term}\t{start}\t{end}\t{registry.files[archive_schema(term)]}")
+        return
+
+    moved = archive_term(url.database, args.term, args.archive_dir)
+    print(f"archived {moved} attendance rows from {args.term}")
+    if args.vacuum:
+        vacuum(url.database)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+from datetime import date, datetime
+from typing import Optional
+
+from sqlmodel import Session
+
+from aggregates import dialect_insert, record_attendance
+from models import AttendanceLog
+
+NATURAL_KEY = ("student_id", "course_id", "session_date")
+
+
+def attendance_row(
+    submitted_by: str,
+    student_id: int,
+    course_id: int,
+    present: bool,
+    session_date: Optional[date] = None,
+    idempotency_key: Optional[str] = None,
+    updated_at: Optional[datetime] = None,
+) -> dict:
+    return {
+        "submitted_by": submitted_by,
+        "updated_at": updated_at or datetime.now(),
+        "student_id": student_id,
+        "course_id": course_id,
+        "session_date": session_date or date.today(),
+        "present": present,
+        "idempotency_key": idempotency_key,
+    }
+
+
+# Writes attendance marks with INSERT ... ON CONFLICT DO UPDATE on
+# (student_id, course_id, session_date), so a retried mark updates its row
+# rather than adding one. Returns the row id for every input row; the caller
+# owns the transaction.
+def upsert_attendance_logs(session: Session, rows: list[dict]) -> list[int]:
+    if not rows:
+        return []
+    # Within one statement a key may only be written once: last mark wins
+    latest = {tuple(row[column] for column in NATURAL_KEY): row for row in rows}
+    unique_rows = list(latest.values())
+
+    # Summary deltas read the rows being replaced, so they must run first
+    record_attendance(session, unique_rows)
+
+    stmt = dialect_insert(session, AttendanceLog)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[getattr(AttendanceLog, column) for column in NATURAL_KEY],
+        set_={
+            "present": stmt.excluded.present,
+            "submitted_by": stmt.excluded.submitted_by,
+            "updated_at": stmt.excluded.updated_at,
+            "idempotency_key": stmt.excluded.idempotency_key,
+        },
+    )
+    # Rows come back matched by their key: asking for them in parameter
+    # order instead (sort_by_parameter_order) costs one INSERT per row
+    stmt = stmt.returning(AttendanceLog.id, *(getattr(AttendanceLog, column) for column in NATURAL_KEY))
+    id_by_key = {tuple(key): log_id for log_id, *key in session.execute(stmt, unique_rows)}
+    return [id_by_key[tuple(row[column] for column in NATURAL_KEY)] for row in rows]
@@ -0,0 +1,412 @@
+"""Latency, throughput and memory benchmark for every route in routes.py.
+
+Seeds a synthetic university at the requested scale, drives each endpoint
+through the in-process ASGI client and writes the results as JSON:
+
+    python benchmark.py --students 50000 --logs 20000000 --database bench.db
+    python benchmark.py --database bench.db --reuse --output after.json --compare before.json
+
+Seeding at full scale takes a while, so ``--reuse`` keeps an existing
+``--database`` file instead of rebuilding it. The attendance feed routes
+hold a stream open per client rather than answering a request, so they
+are the one exception.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional
+
+import httpx
+import orjson
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from aggregates import rebuild_attendance_summary
+from cache import response_cache
+from config import settings
+from db import create_async_db_engine, create_db_engine, get_async_session, get_session, make_async_url
+from main import app
+from models import AttendanceLog, Course, Department, Student, User
+
+LOAD_BATCH_SIZE = 50_000
+# Rows per POST /import request
+IMPORT_ROWS = 100
+PARAMSTYLE_MARKERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+
+
+def bulk_load(engine, table, columns: list[str], rows: Iterable[tuple]) -> int:
+    # Raw DBAPI executemany in fixed-size chunks: no ORM objects, bounded memory
+    marker = PARAMSTYLE_MARKERS[engine.dialect.paramstyle]
+    preparer = engine.dialect.identifier_preparer
+    statement = "INSERT INTO {} ({}) VALUES ({})".format(
+        preparer.format_table(table),
+        ", ".join(preparer.quote(column) for column in columns),
+        ", ".join([marker] * len(columns)),
+    )
+    loaded = 0
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        while batch := list(itertools.islice(rows, LOAD_BATCH_SIZE)):
+            cursor.executemany(statement, batch)
+            loaded += len(batch)
+        connection.commit()
+    finally:
+        connection.close()
+    return loaded
+
+
+@dataclass
+class Scale:
+    departments: int
+    courses: int
+    classes: int
+    students: int
+    staff: int
+    logs: int
+
+
+def seed(engine, scale: Scale, rng: random.Random):
+    start = datetime(2025, 9, 1, 8, 0)
+    step = timedelta(seconds=max(1, 120 * 86400 // max(scale.logs, 1)))
+
+    bulk_load(engine, Department.__table__, ["submitted_by", "updated_at", "department_name"], (
+        ("benchmark", str(start), f"Department {i}") for i in range(scale.departments)
+    ))
+    bulk_load(engine, Course.__table__, [
+        "submitted_by", "updated_at", "course_name", "department_id", "semester", "class_id", "lecture_hours",
+    ], (
+        ("benchmark", str(start), f"Course {i}", i % scale.departments + 1,
+         "Fall" if i % 2 else "Spring", i % scale.classes, 2 + i % 3)
+        for i in range(scale.courses)
+    ))
+    bulk_load(engine, User.__table__, [
+        "submitted_by", "updated_at", "user_type", "full_name", "username", "email", "password",
+    ], (
+        ("benchmark", str(start), "student" if i < scale.students else "staff",
+         f"User {i}", f"user{i}", f"user{i}@example.com", "secret")
+        for i in range(scale.students + scale.staff)
+    ))
+    bulk_load(engine, Student.__table__, ["submitted_by", "updated_at", "user_id", "department_id", "class_id"], (
+        ("benchmark", str(start), i + 1, i % scale.departments + 1, i % scale.classes)
+        for i in range(scale.students)
+    ))
+    # Each pass over the students is a new session day, which keeps
+    # (student_id, course_id, session_date) unique
+    bulk_load(engine, AttendanceLog.__table__, [
+        "submitted_by", "updated_at", "student_id", "course_id", "session_date", "present",
+    ], (
+        ("benchmark", str(start + step * i), i % scale.students + 1,
+         rng.randrange(scale.courses) + 1, (start + timedelta(days=i // scale.students)).date().isoformat(),
+         rng.random() < 0.85)
+        for i in range(scale.logs)
+    ))
+    with Session(engine) as session:
+        rebuild_attendance_summary(session)
+        session.commit()
+
+
+class RSSSampler:
+    # Peak resident set size while a scenario runs, polled from /proc where
+    # available; ru_maxrss (a process-lifetime peak) is the fallback.
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: Callable[[random.Random], str]
+    body: Optional[Callable[[random.Random, int], dict]] = None
+    # A raw request body, for routes that do not take JSON
+    content: Optional[Callable[[random.Random, int], bytes]] = None
+
+
+def scenarios(scale: Scale) -> list[Scenario]:
+    student = lambda rng: rng.randrange(scale.students) + 1
+    course = lambda rng: rng.randrange(scale.courses) + 1
+    department = lambda rng: rng.randrange(scale.departments) + 1
+    run_id = int(time.time() * 1000)
+    return [
+        Scenario("GET /", "GET", lambda rng: "/"),
+        Scenario("GET /students", "GET", lambda rng: "/students"),
+        Scenario("GET /departments", "GET", lambda rng: "/departments"),
+        Scenario("GET /users", "GET", lambda rng: "/users"),
+        Scenario("GET /courses", "GET", lambda rng: "/courses"),
+        Scenario("GET /cache/stats", "GET", lambda rng: "/cache/stats"),
+        Scenario("GET /metrics", "GET", lambda rng: "/metrics"),
+        Scenario("GET /attendance-log", "GET", lambda rng: "/attendance-log"),
+        Scenario("GET /attendance-log?student_id", "GET",
+                 lambda rng: f"/attendance-log?student_id={student(rng)}"),
+        Scenario("GET /attendance-log?course_id&present", "GET",
+                 lambda rng: f"/attendance-log?course_id={course(rng)}&present=false"),
+        Scenario("GET /attendance-log/export?student_id", "GET",
+                 lambda rng: f"/attendance-log/export?student_id={student(rng)}"),
+        Scenario("GET /search", "GET", lambda rng: f"/search?q=user{student(rng)}"),
+        Scenario("GET /classes/{id}/roster", "GET",
+                 lambda rng: (lambda c: f"/classes/{(c - 1) % scale.classes}/roster?course_id={c}")(course(rng))),
+        Scenario("GET /students/{id}/attendance-summary", "GET",
+                 lambda rng: f"/students/{student(rng)}/attendance-summary"),
+        Scenario("GET /courses/{id}/attendance-summary", "GET",
+                 lambda rng: f"/courses/{course(rng)}/attendance-summary"),
+        Scenario("GET /analytics/below-threshold", "GET",
+                 lambda rng: "/analytics/below-threshold?term=2025-fall"),
+        Scenario("GET /analytics/ranking", "GET",
+                 lambda rng: "/analytics/ranking?term=2025-fall&by=course&order=desc"),
+        Scenario("GET /analytics/departments", "GET", lambda rng: "/analytics/departments?term=2025-fall"),
+        Scenario("POST /attendance-log", "POST", lambda rng: "/attendance-log",
+                 lambda rng, i: {"submitted_by": "benchmark", "student_id": student(rng),
+                                 "course_id": course(rng), "present": True}),
+        Scenario("POST /attendance-log/bulk", "POST", lambda rng: "/attendance-log/bulk",
+                 lambda rng, i: {"submitted_by": "benchmark", "course_id": 1, "class_id": 0,
+                                 "entries": [{"student_id": s, "present": True}
+                                             for s in range(1, min(scale.students, 300 * scale.classes), scale.classes)]}),
+        Scenario("POST /departments", "POST", lambda rng: "/departments",
+                 lambda rng, i: {"submitted_by": "benchmark", "department_name": f"Bench {i}"}),
+        Scenario("POST /course", "POST", lambda rng: "/course",
+                 lambda rng, i: {"submitted_by": "benchmark", "course_name": f"Bench {i}",
+                                 "department_id": department(rng), "semester": "Fall",
+                                 "class_id": 0, "lecture_hours": 3}),
+        Scenario("POST /users", "POST", lambda rng: "/users",
+                 lambda rng, i: {"submitted_by": "benchmark", "user_type": "staff",
+                                 "full_name": f"Bench {i}", "username": f"bench-{run_id}-{i}",
+                                 "email": f"bench-{run_id}-{i}@example.com", "password": "secret"}),
+        Scenario("POST /student", "POST", lambda rng: "/student",
+                 lambda rng, i: {"submitted_by": "benchmark", "user_id": student(rng),
+                                 "department_id": department(rng), "class_id": 0}),
+        # Seeded passwords are plaintext, so a user's first login also
+        # rehashes; later ones verify the scrypt hash or hit the verify cache
+        Scenario("POST /login", "POST", lambda rng: "/login",
+                 lambda rng, i: {"username": f"user{student(rng) - 1}", "password": "secret"}),
+        Scenario("POST /import/{kind}", "POST", lambda rng: "/import/courses?format=ndjson",
+                 content=lambda rng, i: b"\n".join(
+                     orjson.dumps({"submitted_by": "benchmark", "course_name": f"Import {i}-{row}",
+                                   "department_id": department(rng), "semester": "Fall",
+                                   "class_id": 0, "lecture_hours": 3})
+                     for row in range(IMPORT_ROWS)
+                 )),
+    ]
+
+
+def use_engines(engine, async_engine):
+    async_session_maker = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    def override_get_session():
+        with Session(engine) as session:
+            yield session
+
+    async def override_get_async_session():
+        async with async_session_maker() as session:
+            yield session
+
+    app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_async_session] = override_get_async_session
+    response_cache.clear()
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int,
+                       concurrency: int, warmup: int, cold_cache: bool, rng: random.Random) -> dict:
+    counter = itertools.count()
+    latencies = []
+    errors = 0
+
+    async def issue():
+        nonlocal errors
+        i = next(counter)
+        if cold_cache:
+            response_cache.clear()
+        body = scenario.body(rng, i) if scenario.body else None
+        content = scenario.content(rng, i) if scenario.content else None
+        started = time.perf_counter()
+        resp = await client.request(scenario.method, scenario.path(rng), json=body, content=content)
+        elapsed = time.perf_counter() - started
+        if resp.status_code >= 400:
+            errors += 1
+        return elapsed
+
+    for _ in range(warmup):
+        await issue()
+
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            latencies.append(await issue())
+
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": requests / wall,
+        "latency_ms": {
+            "mean": statistics.fmean(latencies) * 1000,
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies) * 1000,
+        },
+        "peak_rss_mb": rss.peak / 2**20,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: dict, baseline: Optional[dict]):
+    header = f"{'endpoint':45} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rss MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        latency = result["latency_ms"]
+        line = (f"{name:45} {result['throughput_rps']:9.1f} {latency['p50']:9.2f} "
+                f"{latency['p95']:9.2f} {latency['p99']:9.2f} {result['peak_rss_mb']:8.1f}")
+        previous = (baseline or {}).get(name)
+        if previous:
+            change = latency["p95"] / previous["latency_ms"]["p95"] - 1
+            line += f"   p95 {change:+.0%} vs baseline"
+        if result["errors"]:
+            line += f"   ({result['errors']} errors)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--departments", type=int, default=20)
+    parser.add_argument("--courses", type=int, default=400)
+    parser.add_argument("--classes", type=int, default=100)
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--staff", type=int, default=500)
+    parser.add_argument("--logs", type=int, default=200_000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--only", action="append", help="run only endpoints containing this text")
+    parser.add_argument("--cold-cache", action="store_true", help="clear the response cache before every request")
+    parser.add_argument("--database", help="SQLite file to seed (default: a temporary file)")
+    parser.add_argument("--reuse", action="store_true", help="skip seeding when --database exists")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", help="previous --output file to diff against")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    scale = Scale(args.departments, args.courses, args.classes, args.students, args.staff, args.logs)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.database or os.path.join(tmp, "benchmark.db")
+        url = f"sqlite:///{path}"
+        reuse = args.reuse and os.path.exists(path)
+        engine = create_db_engine(url)
+        async_engine = create_async_db_engine(make_async_url(url))
+
+        if not reuse:
+            SQLModel.metadata.drop_all(engine)
+            SQLModel.metadata.create_all(engine)
+            started = time.perf_counter()
+            seed(engine, scale, rng)
+            print(f"seeded {scale} in {time.perf_counter() - started:.1f}s")
+
+        use_engines(engine, async_engine)
+
+        async def run_all() -> dict:
+            results = {}
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+                for scenario in scenarios(scale):
+                    if args.only and not any(text in scenario.name for text in args.only):
+                        continue
+                    results[scenario.name] = await run_scenario(
+                        client, scenario, args.requests, args.concurrency, args.warmup, args.cold_cache, rng
+                    )
+            await async_engine.dispose()
+            return results
+
+        results = asyncio.run(run_all())
+        engine.dispose()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as previous:
+            baseline = json.load(previous)["results"]
+    print_report(results, baseline)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": vars(scale),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "cold_cache": args.cold_cache,
+            "fast_serialization": settings.fast_serialization,
+            "reused_database": reuse,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import fcntl
+import mmap
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+from config import settings
+
+
+class SharedGenerations:
+    # Write generations in a memory-mapped file, so that every worker process
+    # started by serve.py sees the invalidations of the others. Keys hash into
+    # a fixed array of counters; keys sharing a counter only cost each other
+    # spurious misses. The header holds the boot id all workers put in ETags.
+
+    HEADER_SIZE = 16
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._view = memoryview(self._map)
+        self._counters = self._view[self.HEADER_SIZE:].cast("Q")
+        self.boot_id = bytes(self._view[:self.HEADER_SIZE]).rstrip(b"\0").decode()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path: str, slots: int) -> "SharedGenerations":
+        with open(path, "wb") as file:
+            file.write(uuid.uuid4().hex[:12].encode().ljust(cls.HEADER_SIZE, b"\0"))
+            file.truncate(cls.HEADER_SIZE + 8 * slots)
+        return cls(path)
+
+    def _slot(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % len(self._counters)
+
+    def get(self, key: str) -> int:
+        return self._counters[self._slot(key)]
+
+    def bump(self, *keys: str):
+        # flock only excludes other processes; threads of this one take the lock
+        with self._lock:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                for key in keys:
+                    self._counters[self._slot(key)] += 1
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def close(self):
+        self._counters.release()
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+
+class ResponseCache:
+    # TTL + LRU store of serialized response bodies. Writes run in the
+    # threadpool, so every operation takes the lock.
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, int, bytes]] = OrderedDict()
+        self._generations: dict[str, int] = {}
+        self.shared: Optional[SharedGenerations] = None
+        self._lock = threading.Lock()
+        # Keeps ETags from a previous process from matching reset generations
+        self._boot_id = uuid.uuid4().hex[:12]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def use_shared(self, shared: Optional[SharedGenerations]):
+        with self._lock:
+            self.shared = shared
+            self._entries.clear()
+            if shared is not None:
+                self._boot_id = shared.boot_id
+
+    def _generation(self, key: str) -> int:
+        if self.shared is not None:
+            return self.shared.get(key)
+        return self._generations.get(key, 0)
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            return self._generation(key)
+
+    def etag(self, key: str, generation: Optional[int] = None) -> str:
+        if generation is None:
+            generation = self.generation(key)
+        return f'"{key}-{self._boot_id}-{generation}"'
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            # Another worker may have invalidated the key since it was stored
+            if entry is None or entry[0] < time.monotonic() or entry[1] != self._generation(key):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key: str, value: bytes, generation: int):
+        with self._lock:
+            # An invalidation raced with the load that produced this value
+            if self._generation(key) != generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                if self.shared is None:
+                    self._generations[key] = self._generations.get(key, 0) + 1
+            if self.shared is not None:
+                self.shared.bump(*keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+response_cache = ResponseCache(settings.cache_max_entries, settings.cache_ttl_seconds)
@@ -0,0 +1,92 @@
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    database_url: str = "sqlite:///assessment.db"
+    # Defaults to database_url with its async driver swapped in
+    async_database_url: Optional[str] = None
+    db_echo: bool = False
+
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800
+
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 268435456
+    # Negative values are KiB, positive values are pages
+    sqlite_cache_size: int = -65536
+    sqlite_foreign_keys: bool = True
+
+    # Build list responses from selected columns with orjson rather than
+    # validating ORM objects against the response models
+    fast_serialization: bool = True
+
+    # Share of requests that get SQL/serialization timing and Server-Timing
+    metrics_sample_rate: float = 0.1
+    slow_query_log_size: int = 10
+
+    # Queue single attendance writes and group-commit them in batches;
+    # callers are answered once their batch has committed
+    write_behind: bool = False
+    write_batch_window_ms: float = 2.0
+    write_batch_max_size: int = 500
+    write_queue_max_size: int = 10000
+
+    # Known primary keys used to reject bad foreign keys on create, reloaded
+    # this often; an id missing from them is looked up in the table
+    reference_index_refresh_seconds: float = 60.0
+
+    # In-memory student × course matrices behind /analytics: how stale one
+    # may get before the next request reads new marks, and how many terms
+    # are kept
+    analytics_refresh_seconds: float = 2.0
+    analytics_max_terms: int = 4
+
+    # scrypt cost for stored passwords (n is a power of two; memory use is
+    # about 128 * n * r bytes per hash), the size of the process pool that
+    # computes them (default: one per core), and how long a successful
+    # verification is remembered
+    password_scrypt_n: int = 16384
+    password_scrypt_r: int = 8
+    password_scrypt_p: int = 1
+    password_hash_workers: Optional[int] = None
+    password_verify_cache_size: int = 4096
+    password_verify_cache_ttl_seconds: float = 300.0
+
+    # Rows validated and inserted per transaction by importer.py and
+    # POST /import/{kind}
+    import_chunk_size: int = 5000
+
+    # Attendance change feed: events kept for Last-Event-ID resume, events a
+    # subscriber may have queued before it is switched to catching up from
+    # that history, and how often an idle stream gets a keepalive
+    feed_history_size: int = 10000
+    feed_subscriber_queue_size: int = 256
+    feed_heartbeat_seconds: float = 15.0
+
+    # Finished terms moved out of attendancelog, one SQLite file per year
+    archive_dir: str = "archive"
+
+    cache_max_entries: int = 256
+    cache_ttl_seconds: float = 60.0
+
+    # Set by serve.py for its workers: the schema is created once before they
+    # start, and cache invalidations go through a shared generation file
+    schema_setup: bool = True
+    # Skip schema setup when the database records the current schema version
+    schema_version_check: bool = True
+    # Connections opened on each engine at startup
+    db_pool_prewarm: int = 2
+    cache_bus_path: Optional[str] = None
+    cache_bus_slots: int = 65536
+
+
+settings = Settings()
@@ -0,0 +1,141 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from itertools import repeat
+from typing import Optional
+
+from config import settings
+
+SCHEME = "scrypt"
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+# Runs in the pool's worker processes, so it takes everything as arguments
+def scrypt_hash(password: str, n: int, r: int, p: int, salt: Optional[bytes] = None) -> str:
+    salt = salt if salt is not None else secrets.token_bytes(SALT_BYTES)
+    key = hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=KEY_BYTES
+    )
+    encoded = [base64.b64encode(part).decode() for part in (salt, key)]
+    return "$".join([SCHEME, str(n), str(r), str(p), *encoded])
+
+
+def scrypt_verify(password: str, stored: str) -> bool:
+    _, n, r, p, salt, _ = stored.split("$")
+    expected = scrypt_hash(password, int(n), int(r), int(p), base64.b64decode(salt))
+    return hmac.compare_digest(expected, stored)
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(f"{SCHEME}$") and stored.count("$") == 5
+
+
+class PasswordHasher:
+    # scrypt hashing and verification in a bounded process pool: each call
+    # holds a core for tens of milliseconds, which on the event loop or in
+    # the shared threadpool would stall every other request. The pool is
+    # started on first use; its workers come from a fork server, which is
+    # safe from a process that already runs threads and cheap to restart.
+    #
+    # Successful verifications are remembered for verify_cache_ttl seconds,
+    # keyed by an HMAC of the stored hash and the password under a key that
+    # never leaves this process. A changed password changes the stored hash,
+    # so its old entries can no longer match. Failures are never cached.
+
+    def __init__(self, n: int, r: int, p: int, workers: Optional[int],
+                 verify_cache_size: int, verify_cache_ttl: float):
+        self.n, self.r, self.p = n, r, p
+        self.workers = workers or os.cpu_count() or 1
+        self.verify_cache_size = verify_cache_size
+        self.verify_cache_ttl = verify_cache_ttl
+        self._pool = None
+        self._verified: OrderedDict[bytes, float] = OrderedDict()
+        self._cache_key = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+        # Verified against when a username is unknown, so that a miss costs
+        # as much as a wrong password
+        self._decoy: Optional[str] = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # Imported with the pool, to keep them out of worker startup
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver")
+                )
+            return self._pool
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(scrypt_hash, password, self.n, self.r, self.p)
+
+    # Blocking, for bulk imports that already run off the event loop
+    def hash_many(self, passwords: list[str]) -> list[str]:
+        if not passwords:
+            return []
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        n, r, p = repeat(self.n), repeat(self.r), repeat(self.p)
+        return list(self._executor().map(scrypt_hash, passwords, n, r, p, chunksize=chunksize))
+
+    def needs_rehash(self, stored: str) -> bool:
+        if not is_hashed(stored):
+            return True
+        _, n, r, p, _, _ = stored.split("$")
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+    def _digest(self, password: str, stored: str) -> bytes:
+        return hmac.digest(self._cache_key, f"{stored}\0{password}".encode(), "sha256")
+
+    async def verify(self, password: str, stored: Optional[str]) -> bool:
+        if stored is None:
+            if self._decoy is None:
+                self._decoy = await self.hash(secrets.token_urlsafe())
+            await self._run(scrypt_verify, password, self._decoy)
+            return False
+        if not is_hashed(stored):
+            # Rows written before passwords were hashed; login rehashes them
+            return hmac.compare_digest(stored.encode(), password.encode())
+
+        digest = self._digest(password, stored)
+        now = time.monotonic()
+        with self._lock:
+            expires = self._verified.get(digest)
+            if expires is not None and expires > now:
+                self._verified.move_to_end(digest)
+                return True
+        if not await self._run(scrypt_verify, password, stored):
+            return False
+        with self._lock:
+            self._verified[digest] = now + self.verify_cache_ttl
+            self._verified.move_to_end(digest)
+            while len(self._verified) > self.verify_cache_size:
+                self._verified.popitem(last=False)
+        return True
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._verified.clear()
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(
+    n=settings.password_scrypt_n,
+    r=settings.password_scrypt_r,
+    p=settings.password_scrypt_p,
+    workers=settings.password_hash_workers,
+    verify_cache_size=settings.password_verify_cache_size,
+    verify_cache_ttl=settings.password_verify_cache_ttl_seconds,
+)
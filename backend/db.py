@@ -1,10 +1,251 @@
+import asyncio
+import hashlib
+import logging
+
+from sqlalchemy import Column, String, Table, event, exists, inspect, select, tuple_
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.schema import CreateIndex, CreateTable
 from sqlmodel import create_engine, Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from aggregates import has_attendance_summary, rebuild_attendance_summary
+from archive import attach_archives, attendance_log_source
+from config import Settings, settings
+from instrumentation import instrument_engines
+from models import AttendanceLog
+from search import SEARCH_DDL, has_search_index, rebuild_search_index
+
+logger = logging.getLogger(__name__)
+
+# Backfill expressions for columns added to tables that already exist
+COLUMN_BACKFILLS = {
+    ("attendancelog", "session_date"): "substr(updated_at, 1, 10)",
+}
+
+# Unique indexes added to tables that may already hold duplicates, with the
+# columns whose largest values mark the row to keep
+UNIQUE_INDEX_KEEP_NEWEST = {
+    "ux_attendancelog_student_course_session": ("updated_at", "id"),
+}
+
+# One row holding the fingerprint of the schema the database was last set
+# up with; part of the metadata, so drop_all takes it along with the tables
+schema_version = Table("schema_version", SQLModel.metadata, Column("version", String, primary_key=True))
+
+# Async driver used for each backend when DATABASE_URL names a sync one
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+}
+
+
+def make_async_url(url: str) -> str:
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    return url.render_as_string(hide_password=False)
+
+
+def engine_options(url: str, config: Settings) -> dict:
+    url = make_url(url)
+    options = {
+        "echo": config.db_echo,
+        "pool_pre_ping": config.db_pool_pre_ping,
+        "pool_recycle": config.db_pool_recycle,
+    }
+    # In-memory SQLite is pinned to a single connection, so there is no pool to size
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+    options.update(
+        pool_size=config.db_pool_size,
+        max_overflow=config.db_max_overflow,
+        pool_timeout=config.db_pool_timeout,
+    )
+    return options
+
+
+def apply_sqlite_pragmas(sync_engine, config: Settings):
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={config.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={config.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={config.sqlite_busy_timeout_ms:d}")
+        cursor.execute(f"PRAGMA mmap_size={config.sqlite_mmap_size:d}")
+        cursor.execute(f"PRAGMA cache_size={config.sqlite_cache_size:d}")
+        cursor.execute(f"PRAGMA foreign_keys={'ON' if config.sqlite_foreign_keys else 'OFF'}")
+        cursor.close()
+
+
+def create_db_engine(url: str, config: Settings = settings):
+    engine = create_engine(url, **engine_options(url, config))
+    if engine.dialect.name == "sqlite":
+        apply_sqlite_pragmas(engine, config)
+        attach_archives(engine)
+    return engine
+
+
+def create_async_db_engine(url: str, config: Settings = settings):
+    async_engine = create_async_engine(url, **engine_options(url, config))
+    if async_engine.dialect.name == "sqlite":
+        apply_sqlite_pragmas(async_engine.sync_engine, config)
+        attach_archives(async_engine.sync_engine)
+    return async_engine
+
+
+instrument_engines()
 
-engine = create_engine("sqlite:///assessment.db")
+engine = create_db_engine(settings.database_url)
+async_engine = create_async_db_engine(
+    settings.async_database_url or make_async_url(settings.database_url)
+)
+async_session_maker = async_sessionmaker(
+    async_engine, class_=AsyncSession, expire_on_commit=False
+)
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+async def get_async_session():
+    async with async_session_maker() as session:
+        yield session
         
+def delete_duplicates(conn, table: Table, key_columns: list[str], newest: tuple[str, ...]) -> int:
+    newer = table.alias("newer")
+    return conn.execute(
+        table.delete().where(
+            exists().where(
+                *(newer.c[name] == table.c[name] for name in key_columns),
+                tuple_(*(newer.c[name] for name in newest)) > tuple_(*(table.c[name] for name in newest)),
+            )
+        )
+    ).rowcount
+
+
+# create_all only creates missing tables, so bring existing ones up to date:
+# add new columns (nullable, then backfilled) and any indexes they lack.
+# Duplicates that block a new unique index are deleted, keeping the newest
+# row, and the attendance summary is rebuilt from what remains. An index
+# that still cannot be built stops startup: writes depend on them.
+def upgrade_schema(engine):
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.quote(column.name)} {column.type.compile(engine.dialect)}"
+                )
+                backfill = COLUMN_BACKFILLS.get((table.name, column.name))
+                if backfill:
+                    conn.exec_driver_sql(
+                        f"UPDATE {preparer.format_table(table)} "
+                        f"SET {preparer.quote(column.name)} = {backfill}"
+                    )
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in indexes:
+                continue
+            with engine.begin() as conn:
+                newest = UNIQUE_INDEX_KEEP_NEWEST.get(index.name)
+                if newest:
+                    deleted = delete_duplicates(conn, table, [column.name for column in index.columns], newest)
+                    if deleted:
+                        logger.warning("Deleted %d rows duplicating newer ones on %s", deleted, index.name)
+                        if table.name == AttendanceLog.__tablename__:
+                            rebuild_attendance_summary(Session(bind=conn), attendance_log_source())
+                try:
+                    index.create(conn)
+                except IntegrityError as exc:
+                    raise RuntimeError(f"Existing rows violate {index.name}; the index cannot be created") from exc
+
+
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+    backfill_summary = not has_attendance_summary(engine)
+    backfill_search = engine.dialect.name == "sqlite" and not has_search_index(engine)
+    SQLModel.metadata.create_all(engine)
+    upgrade_schema(engine)
+    if backfill_summary or backfill_search:
+        with Session(engine) as session:
+            if backfill_summary:
+                rebuild_attendance_summary(session, attendance_log_source())
+            if backfill_search:
+                rebuild_search_index(session)
+            session.commit()
+
+
+# Changes whenever a table, column, index or the search DDL does
+def schema_fingerprint(dialect) -> str:
+    ddl = []
+    for table in SQLModel.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+        ddl.extend(
+            str(CreateIndex(index).compile(dialect=dialect))
+            for index in sorted(table.indexes, key=lambda index: index.name)
+        )
+    ddl.extend(SEARCH_DDL)
+    return hashlib.sha256("\n".join(ddl).encode()).hexdigest()[:16]
+
+
+def stored_schema_version(engine):
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(schema_version.c.version)).scalar()
+    except DBAPIError:
+        return None
+
+
+def missing_indexes(engine) -> list[str]:
+    inspector = inspect(engine)
+    return [
+        index.name
+        for table in SQLModel.metadata.sorted_tables
+        for index in table.indexes
+        if index.name not in {existing["name"] for existing in inspector.get_indexes(table.name)}
+    ]
+
+
+# Startup path: a database already set up with this schema skips the
+# reflection and DDL of create_db_and_tables. Returns whether it ran. The
+# version is only recorded once every declared index exists, so a setup
+# that fell short is retried on the next start rather than skipped.
+def ensure_schema() -> bool:
+    version = schema_fingerprint(engine.dialect)
+    if settings.schema_version_check and stored_schema_version(engine) == version:
+        return False
+    create_db_and_tables()
+    missing = missing_indexes(engine)
+    if missing:
+        raise RuntimeError(f"Schema setup did not create {', '.join(missing)}")
+    with engine.begin() as conn:
+        conn.execute(schema_version.delete())
+        conn.execute(schema_version.insert().values(version=version))
+    return True
+
+
+# Opens up to count connections on each engine and returns them to the
+# pool, so the first requests skip connecting, the SQLite pragmas and
+# attaching archives
+async def prewarm_pools(count: int):
+    def prewarm_sync():
+        connections = [engine.connect() for _ in range(count)]
+        for connection in connections:
+            connection.close()
+
+    async def prewarm_async():
+        connections = [await async_engine.connect() for _ in range(count)]
+        for connection in connections:
+            await connection.close()
+
+    await asyncio.gather(asyncio.to_thread(prewarm_sync), prewarm_async())
@@ -0,0 +1,165 @@
+"""Query plan check for every route in routes.py.
+
+Drives each benchmark scenario once against a seeded SQLite database,
+records the SQL the route issues and runs EXPLAIN QUERY PLAN over each
+statement. Exits with status 1 if any statement scans a table holding at
+least ``--min-rows`` rows, apart from the scans listed in ALLOWED_SCANS:
+
+    python explain.py
+    python explain.py --database bench.db --reuse --min-rows 10000 --verbose
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+from collections import defaultdict
+
+import httpx
+from sqlalchemy import event, func, select
+from sqlmodel import SQLModel
+
+from benchmark import Scale, scenarios, seed, use_engines
+from cache import response_cache
+from db import create_async_db_engine, create_db_engine, make_async_url
+from main import app
+
+# Routes whose job is to return a whole table; everything else must reach
+# its rows through an index
+ALLOWED_SCANS = {
+    "GET /students": {"student"},
+    "GET /users": {"user"},
+    "GET /courses": {"course"},
+    "GET /departments": {"department"},
+}
+
+SKIPPED_STATEMENTS = ("PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+ALIAS = re.compile(r'"?(\w+)"? AS "?(\w+)"?')
+
+
+def record_statements(engine, statements: list):
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(SKIPPED_STATEMENTS):
+            return
+        # insertmanyvalues batches report executemany with a single flat row
+        if executemany and parameters and isinstance(parameters[0], (list, tuple, dict)):
+            parameters = parameters[0]
+        statements.append((statement, parameters))
+
+
+def table_sizes(engine) -> dict[str, int]:
+    with engine.connect() as conn:
+        return {
+            table.name: conn.execute(select(func.count()).select_from(table)).scalar()
+            for table in SQLModel.metadata.sorted_tables
+        }
+
+
+def query_plan(engine, statement: str, parameters) -> list[str]:
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def full_scans(statement: str, plan: list[str], sizes: dict[str, int], min_rows: int) -> list[str]:
+    aliases = {alias: table for table, alias in ALIAS.findall(statement)}
+    limited = re.search(r"\bLIMIT\b", statement, re.IGNORECASE) is not None
+    in_order = not any("TEMP B-TREE FOR ORDER BY" in detail for detail in plan)
+    scanned = []
+    for detail in plan:
+        if not detail.startswith("SCAN ") or "VIRTUAL TABLE" in detail:
+            continue
+        name = detail.split()[1]
+        table = aliases.get(name, name)
+        if sizes.get(table, 0) < min_rows:
+            continue
+        # Walking an index or the rowids in order and stopping at LIMIT is a
+        # keyset page
+        if limited and in_order:
+            continue
+        scanned.append(table)
+    return scanned
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", help="SQLite file to seed (default: a temporary file)")
+    parser.add_argument("--reuse", action="store_true", help="skip seeding when --database exists")
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--logs", type=int, default=50_000)
+    parser.add_argument("--min-rows", type=int, default=1000, help="smallest table worth flagging")
+    parser.add_argument("--verbose", action="store_true", help="print every plan, not just failures")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    scale = Scale(departments=20, courses=200, classes=50, students=args.students,
+                  staff=args.students // 10, logs=args.logs)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.database or os.path.join(tmp, "explain.db")
+        url = f"sqlite:///{path}"
+        engine = create_db_engine(url)
+        async_engine = create_async_db_engine(make_async_url(url))
+        if not (args.reuse and os.path.exists(path)):
+            SQLModel.metadata.drop_all(engine)
+            SQLModel.metadata.create_all(engine)
+            seed(engine, scale, rng)
+        engine.dispose()
+        sizes = table_sizes(engine)
+        use_engines(engine, async_engine)
+
+        statements = []
+        record_statements(engine, statements)
+        record_statements(async_engine.sync_engine, statements)
+        issued = defaultdict(dict)
+
+        async def drive():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://explain", timeout=None) as client:
+                for scenario in scenarios(scale):
+                    # The first request warms the reference index; the
+                    # second shows the steady state, minus response caching
+                    for i in range(2):
+                        response_cache.clear()
+                        statements.clear()
+                        body = scenario.body(rng, i) if scenario.body else None
+                        content = scenario.content(rng, i) if scenario.content else None
+                        resp = await client.request(scenario.method, scenario.path(rng), json=body, content=content)
+                    if resp.status_code >= 400:
+                        print(f"{scenario.name}: HTTP {resp.status_code}", file=sys.stderr)
+                    for statement, parameters in statements:
+                        issued[scenario.name].setdefault(statement, parameters)
+            await async_engine.dispose()
+
+        asyncio.run(drive())
+
+        failures = 0
+        for name, by_statement in issued.items():
+            for statement, parameters in by_statement.items():
+                plan = query_plan(engine, statement, parameters)
+                scanned = [
+                    table for table in full_scans(statement, plan, sizes, args.min_rows)
+                    if table not in ALLOWED_SCANS.get(name, ())
+                ]
+                failures += bool(scanned)
+                if scanned or args.verbose:
+                    status = f"FULL SCAN of {', '.join(scanned)}" if scanned else "ok"
+                    print(f"{name}: {status}\n  {' '.join(statement.split())[:300]}")
+                    for detail in plan:
+                        print(f"    {detail}")
+        engine.dispose()
+
+    print(f"{failures} statement(s) with full scans of tables over {args.min_rows} rows")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import uuid
+from collections import deque
+from typing import Optional
+
+from config import settings
+
+
+class Subscription:
+    # One client's view of the feed. Events are handed over through a
+    # bounded queue; when it is full the subscriber is marked as lagging
+    # instead of making the publisher wait, and catches up from the feed's
+    # history once it has drained what it already has.
+
+    def __init__(self, feed: "AttendanceFeed", topics: frozenset, last_seq: int, queue_size: int):
+        self.feed = feed
+        self.topics = topics
+        self.last_seq = last_seq
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.lagging = False
+
+    def wants(self, event: dict) -> bool:
+        return not self.topics or not self.topics.isdisjoint(event["topics"])
+
+    # Runs on the subscriber's loop
+    def offer(self, event: dict):
+        if self.lagging:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagging = True
+
+    async def next(self, timeout: float) -> Optional[dict]:
+        # An event after last_seq, a reset event when the missed ones are no
+        # longer in history, or None when nothing arrived within timeout
+        while True:
+            if self.lagging and self.queue.empty():
+                self.lagging = False
+                missed = self.feed.since(self.last_seq, self.topics)
+                if missed is None:
+                    self.last_seq = self.feed.head()
+                    return self.feed.reset_event()
+                for event in missed:
+                    self.offer(event)
+                continue
+            try:
+                event = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            # Replayed history and live delivery can overlap
+            if event["seq"] <= self.last_seq:
+                continue
+            self.last_seq = event["seq"]
+            return event
+
+
+class AttendanceFeed:
+    # In-process broker for attendance changes. Write paths publish after
+    # they commit, from the event loop or a threadpool thread; each event
+    # gets the next sequence number and goes into a ring buffer of the last
+    # history_size events, which is what Last-Event-ID resumes from. Event
+    # ids carry a per-process boot id, so an id from before a restart (or
+    # from another worker) is answered with a reset rather than a gap.
+
+    def __init__(self, history_size: int, queue_size: int):
+        self.history: deque = deque(maxlen=history_size)
+        self.queue_size = queue_size
+        self.boot_id = uuid.uuid4().hex[:12]
+        self._seq = 0
+        self._subscribers: set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.boot_id}-{seq}"
+
+    def head(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def reset_event(self) -> dict:
+        return {"seq": None, "id": self.event_id(self.head()), "event": "reset", "data": {}}
+
+    def publish(self, data: dict, topics: tuple[str, ...]):
+        with self._lock:
+            self._seq += 1
+            event = {
+                "seq": self._seq,
+                "id": self.event_id(self._seq),
+                "event": "attendance",
+                "topics": frozenset(topics),
+                "data": data,
+            }
+            self.history.append(event)
+            # Scheduled under the lock so every loop sees events in sequence
+            for subscriber in self._subscribers:
+                if subscriber.wants(event):
+                    subscriber.loop.call_soon_threadsafe(subscriber.offer, event)
+
+    def publish_mark(self, log_id: int, row: dict, class_id: Optional[int]):
+        data = {
+            "log_id": log_id,
+            "student_id": row["student_id"],
+            "course_id": row["course_id"],
+            "class_id": class_id,
+            "session_date": row["session_date"],
+            "present": row["present"],
+            # As the stored column reads back, to match the REST responses
+            "updated_at": str(row["updated_at"]),
+        }
+        topics = (f"course:{row['course_id']}",) + ((f"class:{class_id}",) if class_id is not None else ())
+        self.publish(data, topics)
+
+    def since(self, seq: int, topics: frozenset) -> Optional[list[dict]]:
+        with self._lock:
+            if seq > self._seq:
+                return None
+            first = self.history[0]["seq"] if self.history else self._seq + 1
+            if seq < first - 1:
+                return None
+            return [
+                event for event in list(self.history)[seq - first + 1:]
+                if not topics or not topics.isdisjoint(event["topics"])
+            ]
+
+    def parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        # The sequence number to resume after, or None if event_id is not
+        # one of this process's
+        if not event_id:
+            return None
+        boot_id, _, seq = event_id.rpartition("-")
+        if boot_id != self.boot_id or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def subscribe(self, topics: frozenset, last_event_id: Optional[str] = None) -> tuple[Subscription, bool]:
+        # Returns the subscription and whether the requested resume point
+        # was lost, in which case the client must start over
+        resume = self.parse_event_id(last_event_id)
+        with self._lock:
+            subscription = Subscription(self, topics, self._seq, self.queue_size)
+            self._subscribers.add(subscription)
+        if resume is None:
+            return subscription, last_event_id is not None
+        missed = self.since(resume, topics)
+        if missed is None:
+            return subscription, True
+        subscription.last_seq = resume
+        for event in missed:
+            subscription.offer(event)
+        return subscription, False
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscribers(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+
+attendance_feed = AttendanceFeed(
+    history_size=settings.feed_history_size,
+    queue_size=settings.feed_subscriber_queue_size,
+)
@@ -0,0 +1,201 @@
+"""Bulk import of users, students and courses from CSV or NDJSON.
+
+Rows are read as a stream and handled in chunks: each chunk is validated
+against the create schema, checked for duplicate usernames/emails and
+missing references with one lookup per column, and inserted in a single
+transaction. Bad rows are reported and skipped; memory use depends on the
+chunk size, not the file size.
+
+    python importer.py users users.csv
+    python importer.py students students.ndjson --chunk-size 10000
+
+Running servers only drop their cached lists and ETags for the imported
+tables if this process can reach their generation file: start them with
+serve.py and the same ``CACHE_BUS_PATH`` in both environments. Otherwise
+import through a running server with ``POST /import/{kind}``.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from itertools import islice
+from typing import Iterable, Iterator
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlmodel import Session
+
+from cache import SharedGenerations, response_cache
+from config import settings
+from credentials import password_hasher
+from db import ensure_schema, engine
+from models import Course, CourseAdd, Department, Student, StudentCreate, User, UserCreate
+from references import reference_index
+
+IMPORT_KINDS = {
+    "users": (UserCreate, User),
+    "students": (StudentCreate, Student),
+    "courses": (CourseAdd, Course),
+}
+# Columns that must be unique across the table, and columns that point at
+# another table's id
+UNIQUE_COLUMNS = {"users": ("username", "email")}
+REFERENCE_COLUMNS = {
+    "students": {"user_id": User, "department_id": Department},
+    "courses": {"department_id": Department},
+}
+
+
+def read_csv(stream: io.TextIOBase) -> Iterator[tuple[int, object]]:
+    reader = csv.DictReader(stream)
+    for number, row in enumerate(reader, start=1):
+        yield number, row
+
+
+def read_ndjson(stream: io.TextIOBase) -> Iterator[tuple[int, object]]:
+    number = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            yield number, orjson.loads(line)
+        except orjson.JSONDecodeError as exc:
+            yield number, exc
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def row_error(number: int, errors: list) -> dict:
+    return {"row": number, "errors": errors}
+
+
+def field_error(field: str, msg: str, value) -> dict:
+    return {"type": "value_error", "loc": [field], "msg": msg, "input": value}
+
+
+def validate_chunk(kind: str, chunk: list[tuple[int, object]]) -> tuple[list[tuple[int, dict]], list[dict]]:
+    schema, _ = IMPORT_KINDS[kind]
+    valid, errors = [], []
+    for number, row in chunk:
+        if isinstance(row, Exception):
+            errors.append(row_error(number, [{"type": "json_invalid", "loc": [], "msg": str(row)}]))
+            continue
+        try:
+            valid.append((number, schema.model_validate(row).model_dump()))
+        except ValidationError as exc:
+            errors.append(row_error(number, exc.errors(include_url=False, include_context=False)))
+    return valid, errors
+
+
+def check_chunk(session: Session, kind: str, rows: list[tuple[int, dict]]) -> tuple[list[tuple[int, dict]], list[dict]]:
+    _, model = IMPORT_KINDS[kind]
+    problems: dict[int, list] = {}
+
+    for column in UNIQUE_COLUMNS.get(kind, ()):
+        values = {row[column] for _, row in rows}
+        # Earlier chunks are committed by now, so the table covers them
+        taken = set(session.scalars(select(getattr(model, column)).where(getattr(model, column).in_(values))))
+        for number, row in rows:
+            value = row[column]
+            if value in taken:
+                problems.setdefault(number, []).append(field_error(column, f"{column} already exists", value))
+            taken.add(value)
+
+    for column, target in REFERENCE_COLUMNS.get(kind, {}).items():
+        values = {row[column] for _, row in rows}
+        known = set(session.scalars(select(target.id).where(target.id.in_(values))))
+        for number, row in rows:
+            if row[column] not in known:
+                problems.setdefault(number, []).append(
+                    field_error(column, f"{target.__name__} {row[column]} does not exist", row[column])
+                )
+
+    valid = [(number, row) for number, row in rows if number not in problems]
+    return valid, [row_error(number, errors) for number, errors in sorted(problems.items())]
+
+
+def insert_chunk(session: Session, kind: str, rows: list[dict]) -> list[int]:
+    _, model = IMPORT_KINDS[kind]
+    if kind == "users":
+        for row, password_hash in zip(rows, password_hasher.hash_many([row["password"] for row in rows])):
+            row["password"] = password_hash
+    stmt = insert(model.__table__).returning(model.__table__.c.id, sort_by_parameter_order=True)
+    ids = session.scalars(stmt, rows).all()
+    session.commit()
+
+    for row_id in ids:
+        reference_index.add(session, model, row_id)
+    if kind == "students":
+        response_cache.invalidate("students", *{f"roster-class:{row['class_id']}" for row in rows})
+    else:
+        response_cache.invalidate(kind)
+    return ids
+
+
+def import_rows(
+    session: Session,
+    kind: str,
+    rows: Iterable[tuple[int, object]],
+    chunk_size: int = settings.import_chunk_size,
+) -> Iterator[dict]:
+    # Yields every rejected row as it is found and a progress record after
+    # each chunk; the last record has "done": true
+    processed = inserted = rejected = 0
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        valid, errors = validate_chunk(kind, chunk)
+        valid, problems = check_chunk(session, kind, valid)
+        errors.extend(problems)
+        if valid:
+            inserted += len(insert_chunk(session, kind, [row for _, row in valid]))
+        processed += len(chunk)
+        rejected += len(errors)
+        yield from sorted(errors, key=lambda error: error["row"])
+        yield {"processed": processed, "inserted": inserted, "rejected": rejected}
+    yield {"processed": processed, "inserted": inserted, "rejected": rejected, "done": True}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("kind", choices=sorted(IMPORT_KINDS))
+    parser.add_argument("path", help="CSV or NDJSON file, or - for stdin")
+    parser.add_argument("--format", choices=sorted(READERS), help="default: from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=settings.import_chunk_size)
+    args = parser.parse_args()
+
+    file_format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    ensure_schema()
+    if settings.cache_bus_path and os.path.exists(settings.cache_bus_path):
+        response_cache.use_shared(SharedGenerations(settings.cache_bus_path))
+    else:
+        print(
+            "warning: CACHE_BUS_PATH is not serve.py's generation file, so running servers keep"
+            " serving cached lists until their next write; use POST /import/{kind} instead",
+            file=sys.stderr,
+        )
+    stream = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+    try:
+        with Session(engine) as session:
+            for record in import_rows(session, args.kind, READERS[file_format](stream), args.chunk_size):
+                if "row" in record:
+                    print(json.dumps(record, default=str), file=sys.stderr)
+                else:
+                    print(
+                        f"{record['processed']} rows read, {record['inserted']} inserted,"
+                        f" {record['rejected']} rejected{' (done)' if record.get('done') else ''}"
+                    )
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        password_hasher.shutdown()
+        if response_cache.shared is not None:
+            response_cache.shared.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import bisect
+import functools
+import inspect
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    __slots__ = ("query_count", "sql_time", "serialize_time", "slow_statements", "endpoint_done")
+
+    def __init__(self):
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.slow_statements: list[tuple[float, str]] = []
+        self.endpoint_done: Optional[float] = None
+
+    def record_query(self, statement: str, elapsed: float):
+        self.query_count += 1
+        self.sql_time += elapsed
+        bisect.insort(self.slow_statements, (elapsed, statement), key=lambda item: -item[0])
+        del self.slow_statements[settings.slow_query_log_size:]
+
+
+# Set only for sampled requests; everything below is a no-op when it is None
+current_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_stats", default=None)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    if stats is not None and conn.info.get("query_start"):
+        stats.record_query(statement, time.perf_counter() - conn.info["query_start"].pop())
+
+
+# Hooks every Engine, including ones built outside db.py such as test engines
+def instrument_engines():
+    for name, listener in (
+        ("before_cursor_execute", before_cursor_execute),
+        ("after_cursor_execute", after_cursor_execute),
+    ):
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
+
+
+@contextmanager
+def track_serialization():
+    stats = current_stats.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialize_time += time.perf_counter() - started
+
+
+class InstrumentedRoute(APIRoute):
+    # Marks when the endpoint returns, so the time FastAPI then spends
+    # validating and encoding the response model counts as serialization.
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def timed_endpoint(*args, **kw):
+                try:
+                    return await endpoint(*args, **kw)
+                finally:
+                    mark_endpoint_done()
+        else:
+            @functools.wraps(endpoint)
+            def timed_endpoint(*args, **kw):
+                try:
+                    return endpoint(*args, **kw)
+                finally:
+                    mark_endpoint_done()
+        super().__init__(path, timed_endpoint, **kwargs)
+
+
+def mark_endpoint_done():
+    stats = current_stats.get()
+    if stats is not None:
+        stats.endpoint_done = time.perf_counter()
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", " ").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests: dict[tuple[str, str, int], int] = {}
+            self.durations: dict[tuple[str, str], list] = {}
+            self.sampled: dict[tuple[str, str], list] = {}
+            self.slow_statements: list[tuple[float, str, str]] = []
+
+    def observe(self, method: str, route: str, status: int, elapsed: float,
+                stats: Optional[RequestStats]):
+        with self._lock:
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            # [bucket counts..., sum, count]
+            histogram = self.durations.setdefault(
+                (method, route), [0] * len(DURATION_BUCKETS) + [0.0, 0]
+            )
+            bucket = bisect.bisect_left(DURATION_BUCKETS, elapsed)
+            if bucket < len(DURATION_BUCKETS):
+                histogram[bucket] += 1
+            histogram[-2] += elapsed
+            histogram[-1] += 1
+            if stats is None:
+                return
+            # [sampled requests, queries, sql seconds, serialization seconds]
+            sampled = self.sampled.setdefault((method, route), [0, 0, 0.0, 0.0])
+            sampled[0] += 1
+            sampled[1] += stats.query_count
+            sampled[2] += stats.sql_time
+            sampled[3] += stats.serialize_time
+            for elapsed_query, statement in stats.slow_statements:
+                self.slow_statements.append((elapsed_query, route, statement))
+            self.slow_statements.sort(key=lambda item: -item[0])
+            del self.slow_statements[settings.slow_query_log_size:]
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            lines.append("# HELP http_requests_total Requests handled, by route and status.")
+            lines.append("# TYPE http_requests_total counter")
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+            lines.append("# HELP http_request_duration_seconds Time from request start to response end.")
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for (method, route), histogram in sorted(self.durations.items()):
+                labels = f'method="{method}",route="{route}"'
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, histogram):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram[-1]}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {histogram[-2]}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {histogram[-1]}")
+
+            for index, (name, kind, help_text) in enumerate([
+                ("instrumented_requests_total", "counter", "Requests sampled for SQL and serialization timing."),
+                ("db_queries_total", "counter", "SQL statements issued by sampled requests."),
+                ("db_query_seconds_total", "counter", "SQL execution time of sampled requests."),
+                ("response_serialization_seconds_total", "counter", "Response serialization time of sampled requests."),
+            ]):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (method, route), values in sorted(self.sampled.items()):
+                    lines.append(f'{name}{{method="{method}",route="{route}"}} {values[index]}')
+
+            lines.append("# HELP db_slowest_statement_seconds Slowest SQL statements seen in sampled requests.")
+            lines.append("# TYPE db_slowest_statement_seconds gauge")
+            for rank, (elapsed, route, statement) in enumerate(self.slow_statements, start=1):
+                lines.append(
+                    f'db_slowest_statement_seconds{{rank="{rank}",route="{route}",'
+                    f'statement="{escape_label(statement[:200])}"}} {elapsed}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class InstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        stats = RequestStats() if random.random() < settings.metrics_sample_rate else None
+        token = current_stats.set(stats)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start" and stats is not None:
+                now = time.perf_counter()
+                if stats.endpoint_done is not None:
+                    stats.serialize_time += now - stats.endpoint_done
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(stats, now - started).encode()))
+                message = {**message, "headers": headers}
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            route = scope.get("route")
+            metrics.observe(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status_code,
+                time.perf_counter() - started,
+                stats,
+            )
+
+
+def server_timing(stats: RequestStats, total: float) -> str:
+    return ", ".join([
+        f'db;dur={stats.sql_time * 1000:.3f};desc="{stats.query_count} queries"',
+        f"serialize;dur={stats.serialize_time * 1000:.3f}",
+        f"total;dur={total * 1000:.3f}",
+    ])
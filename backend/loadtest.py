@@ -0,0 +1,190 @@
+"""Concurrent throughput of the async read routes against the previous
+pattern of a synchronous Session inside an ``async def`` handler.
+
+    python loadtest.py --requests 2000 --concurrency 50 --io-delay-ms 0.2
+
+``--io-delay-ms`` stalls SQLite every few thousand VM steps to stand in for
+storage or network latency; with an all-in-memory database and zero delay
+the comparison measures only driver overhead.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, Session, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from cache import response_cache
+from db import get_async_session, get_session
+from main import app
+from models import (
+    AttendanceLog, AttendanceLogRead, Course, CourseRead, Department, DepartmentRead,
+    Student, StudentRead, User, UserRead,
+)
+from routes import ATTENDANCE_LOG_READ_OPTIONS, COURSE_READ_OPTIONS, STUDENT_READ_OPTIONS
+
+# A mix of small reference lists and DB-bound attendance lookups; the latter
+# is where a blocked event loop serializes everything behind the query.
+PATHS = [
+    "/departments",
+    "/courses",
+    "/attendance-log?limit=20",
+    "/attendance-log?present=false&limit=20",
+    "/attendance-log?student_id=7&present=false",
+]
+
+
+def seed(engine, students: int, logs_per_student: int):
+    now = datetime.now()
+    with Session(engine) as session:
+        session.execute(insert(Department), [
+            {"submitted_by": "loadtest", "updated_at": now, "department_name": f"Department {i}"}
+            for i in range(10)
+        ])
+        session.execute(insert(Course), [
+            {"submitted_by": "loadtest", "updated_at": now, "course_name": f"Course {i}",
+             "department_id": i % 10 + 1, "semester": "Fall", "class_id": i % 20, "lecture_hours": 3}
+            for i in range(50)
+        ])
+        session.execute(insert(User), [
+            {"submitted_by": "loadtest", "updated_at": now, "user_type": "student",
+             "full_name": f"Student {i}", "username": f"student{i}",
+             "email": f"student{i}@example.com", "password": "secret"}
+            for i in range(students)
+        ])
+        session.execute(insert(Student), [
+            {"submitted_by": "loadtest", "updated_at": now, "user_id": i + 1,
+             "department_id": i % 10 + 1, "class_id": i % 20}
+            for i in range(students)
+        ])
+        session.execute(insert(AttendanceLog), [
+            {"submitted_by": "loadtest", "updated_at": now, "student_id": i % students + 1,
+             "course_id": i % 50 + 1, "session_date": date(2025, 9, 1) + timedelta(days=i // students),
+             "present": i % 4 != 0}
+            for i in range(students * logs_per_student)
+        ])
+        session.commit()
+
+
+def add_io_delay(engine, delay_ms: float):
+    @event.listens_for(engine, "connect")
+    def set_progress_handler(dbapi_connection, connection_record):
+        # aiosqlite wraps the sqlite3 connection its worker thread drives
+        raw = getattr(dbapi_connection, "driver_connection", dbapi_connection)
+        raw = getattr(raw, "_conn", raw)
+        raw.set_progress_handler(lambda: time.sleep(delay_ms / 1000) or 0, 100)
+
+
+def build_baseline_app(engine) -> FastAPI:
+    baseline = FastAPI()
+
+    # The pre-async handlers: blocking queries on the event loop thread
+    @baseline.get("/students", response_model=List[StudentRead])
+    async def read_students():
+        with Session(engine) as session:
+            return session.exec(select(Student).options(*STUDENT_READ_OPTIONS)).all()
+
+    @baseline.get("/departments", response_model=List[DepartmentRead])
+    async def read_departments():
+        with Session(engine) as session:
+            return session.exec(select(Department)).all()
+
+    @baseline.get("/courses", response_model=List[CourseRead])
+    async def read_courses():
+        with Session(engine) as session:
+            return session.exec(select(Course).options(*COURSE_READ_OPTIONS)).all()
+
+    @baseline.get("/users", response_model=List[UserRead])
+    async def read_users():
+        with Session(engine) as session:
+            return session.exec(select(User)).all()
+
+    @baseline.get("/attendance-log", response_model=List[AttendanceLogRead])
+    async def read_attendance_log(
+        student_id: int | None = None, present: bool | None = None, limit: int = 100
+    ):
+        query = select(AttendanceLog).options(*ATTENDANCE_LOG_READ_OPTIONS)
+        if student_id is not None:
+            query = query.where(AttendanceLog.student_id == student_id)
+        if present is not None:
+            query = query.where(AttendanceLog.present == present)
+        with Session(engine) as session:
+            return session.exec(
+                query.order_by(AttendanceLog.id).limit(limit)
+            ).all()
+
+    return baseline
+
+
+async def run_load(target: FastAPI, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=target)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(PATHS[i % len(PATHS)])
+
+        async def worker():
+            while not queue.empty():
+                path = queue.get_nowait()
+                resp = await client.get(path)
+                resp.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--logs-per-student", type=int, default=50)
+    parser.add_argument("--io-delay-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "loadtest.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=args.concurrency)
+        SQLModel.metadata.create_all(engine)
+        seed(engine, args.students, args.logs_per_student)
+        if args.io_delay_ms:
+            engine.dispose()
+            add_io_delay(engine, args.io_delay_ms)
+            add_io_delay(async_engine.sync_engine, args.io_delay_ms)
+
+        async def override_get_async_session():
+            async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                yield session
+
+        app.dependency_overrides[get_async_session] = override_get_async_session
+        app.dependency_overrides[get_session] = lambda: Session(engine)
+        # The baseline has no response cache; with it on, the reference
+        # lists would come from memory and the comparison would not be of
+        # the database layer alone
+        response_cache.clear()
+        response_cache.max_entries = 0
+
+        async def compare():
+            baseline = await run_load(build_baseline_app(engine), args.requests, args.concurrency)
+            current = await run_load(app, args.requests, args.concurrency)
+            await async_engine.dispose()
+            return baseline, current
+
+        baseline, current = asyncio.run(compare())
+        print(f"sync session in async handler: {baseline:8.1f} req/s")
+        print(f"async session:                 {current:8.1f} req/s")
+        print(f"speedup:                       {current / baseline:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,37 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 
-from db import create_db_and_tables
+from sqlmodel import Session
+
+from cache import SharedGenerations, response_cache
+from config import settings
+from credentials import password_hasher
+from db import ensure_schema, async_engine, engine, prewarm_pools
+from instrumentation import InstrumentationMiddleware
+from write_queue import attendance_write_queue
 
 from routes import router as main_router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_db_and_tables()
+    if settings.schema_setup:
+        ensure_schema()
+    if settings.db_pool_prewarm:
+        await prewarm_pools(min(settings.db_pool_prewarm, settings.db_pool_size))
+    if settings.cache_bus_path:
+        response_cache.use_shared(SharedGenerations(settings.cache_bus_path))
+    if settings.write_behind:
+        await attendance_write_queue.start(lambda: Session(engine))
     yield
+    await attendance_write_queue.stop()
+    password_hasher.shutdown()
+    await async_engine.dispose()
+    if response_cache.shared is not None:
+        shared = response_cache.shared
+        response_cache.use_shared(None)
+        shared.close()
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(InstrumentationMiddleware)
 
 app.include_router(main_router)
\ No newline at end of file
@@ -1,7 +1,9 @@
 from typing import List, ClassVar, Optional
-from datetime import datetime
+from datetime import date, datetime
+from pydantic import computed_field
 from sqlmodel import Field, SQLModel
 
+from sqlalchemy import Index
 from sqlalchemy.orm import relationship
 
 
@@ -29,6 +31,10 @@ class UserCreate(SQLModel):
     password: str
     submitted_by: str
 
+class UserLogin(SQLModel):
+    username: str
+    password: str
+
 class UserRead(BaseModel):
     user_type: str
     full_name: str
@@ -52,7 +58,7 @@ class DepartmentRead(SQLModel):
 
 class Course(BaseModel, table=True):
     course_name: str
-    department_id: int = Field(foreign_key="department.id")
+    department_id: int = Field(foreign_key="department.id", index=True)
     semester: str
     class_id: int = Field(index=True)
     lecture_hours: int
@@ -79,8 +85,8 @@ class CourseRead(BaseModel):
     lecture_hours: int
 
 class Student(BaseModel, table=True):
-    user_id: int = Field(foreign_key="user.id")
-    department_id: int = Field(foreign_key="department.id")
+    user_id: int = Field(foreign_key="user.id", index=True)
+    department_id: int = Field(foreign_key="department.id", index=True)
     class_id: int = Field(index=True)
     attendance_logs: ClassVar[Optional["AttendanceLog"]] = relationship(
         "AttendanceLog", back_populates="student"
@@ -108,9 +114,31 @@ class StudentRead(SQLModel):
 
 
 class AttendanceLog(BaseModel, table=True):
+    # Keyset pagination walks id, which unlike updated_at never changes when
+    # a mark is upserted; the filtered variants lead with the equality
+    # column so a filter plus a page is a single range scan.
+    __table_args__ = (
+        Index("ix_attendancelog_updated_at_id", "updated_at", "id"),
+        Index("ix_attendancelog_student_id", "student_id", "id"),
+        Index("ix_attendancelog_course_id", "course_id", "id"),
+        # Covers roll-call reads (who was present in a course) without
+        # touching the table
+        Index("ix_attendancelog_course_student_present", "course_id", "student_id", "present"),
+        # One mark per student per course per lecture day; writes upsert on it
+        Index(
+            "ux_attendancelog_student_course_session",
+            "student_id", "course_id", "session_date",
+            unique=True,
+        ),
+        Index("ux_attendancelog_idempotency_key", "idempotency_key", unique=True),
+        # Archived terms keep their ids, so SQLite must never hand them out again
+        {"sqlite_autoincrement": True},
+    )
     student_id: int = Field(foreign_key="student.id")
     course_id: int = Field(foreign_key="course.id")
+    session_date: date = Field(default_factory=date.today)
     present: bool = Field(default=False)
+    idempotency_key: Optional[str] = Field(default=None)
     student: ClassVar[Optional["Student"]] = relationship(
         Student, back_populates="attendance_logs"
     )
@@ -121,6 +149,7 @@ class AttendanceLog(BaseModel, table=True):
 class AttendanceLogRead(BaseModel):
     student: StudentRead
     course: CourseRead
+    session_date: date
     present: bool
 
 class AttendanceLogCreate(SQLModel):
@@ -128,3 +157,93 @@ class AttendanceLogCreate(SQLModel):
     student_id: int
     course_id: int
     present: bool
+    session_date: Optional[date] = None
+
+class AttendanceLogBulkEntry(SQLModel):
+    student_id: int
+    present: bool
+
+class AttendanceLogBulkCreate(SQLModel):
+    submitted_by: str
+    course_id: int
+    class_id: int
+    session_date: Optional[date] = None
+    entries: List[AttendanceLogBulkEntry]
+
+class AttendanceLogBulkResult(SQLModel):
+    student_id: int
+    present: bool
+    id: Optional[int] = None
+    status: str
+    detail: Optional[str] = None
+
+
+class AttendanceSummary(SQLModel, table=True):
+    # Running present/total counts per (student, course), kept in step with
+    # every AttendanceLog write so summaries never scan the log.
+    student_id: int = Field(foreign_key="student.id", primary_key=True)
+    course_id: int = Field(foreign_key="course.id", primary_key=True, index=True)
+    present_count: int = Field(default=0)
+    total_count: int = Field(default=0)
+
+class AttendanceSummaryRead(SQLModel):
+    student_id: int
+    course_id: int
+    present_count: int
+    total_count: int
+
+    @computed_field
+    @property
+    def attendance_rate(self) -> float:
+        return self.present_count / self.total_count if self.total_count else 0.0
+
+
+class AttendanceRate(SQLModel):
+    student_id: int
+    course_id: int
+    present_count: int
+    total_count: int
+    attendance_rate: float
+
+
+class AttendanceRanking(SQLModel):
+    # A student or course id, depending on what was ranked
+    id: int
+    present_count: int
+    total_count: int
+    attendance_rate: float
+
+
+class DepartmentAttendance(SQLModel):
+    department_id: int
+    courses: int
+    students: int
+    students_below_threshold: int
+    present_count: int
+    total_count: int
+    attendance_rate: float
+
+
+class RosterAttendance(SQLModel):
+    session_date: date
+    present: bool
+    updated_at: str | None
+
+
+class RosterEntry(SQLModel):
+    student_id: int
+    user: UserRead
+    # The student's most recent mark for the requested course
+    latest_attendance: Optional[RosterAttendance] = None
+
+
+class SearchResult(SQLModel):
+    kind: str
+    id: int
+    name: str
+    username: Optional[str] = None
+    email: Optional[str] = None
+    # Set for users that are enrolled as students
+    student_id: Optional[int] = None
+    # Negated bm25, so higher is a better match
+    score: float
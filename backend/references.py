@@ -0,0 +1,93 @@
+import threading
+import time
+import weakref
+
+from fastapi.exceptions import RequestValidationError
+from sqlalchemy import select
+from sqlmodel import Session
+
+from config import settings
+
+
+class ReferenceIndex:
+    # In-memory primary key sets for the tables that create payloads point
+    # at, so a bad foreign key is rejected before a transaction is opened.
+    # Each set is loaded per engine on first use, reloaded every
+    # refresh_seconds, and extended as the create routes insert rows. A miss
+    # may just be a row written by another process (a serve.py worker, an
+    # import), so it is settled by looking up that one key.
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._indexes = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _entry(self, bind, model):
+        with self._lock:
+            return self._indexes.get(bind, {}).get(model.__tablename__)
+
+    def _load(self, bind, model) -> set:
+        with bind.connect() as conn:
+            ids = set(conn.execute(select(model.id)).scalars())
+        with self._lock:
+            self._indexes.setdefault(bind, {})[model.__tablename__] = (time.monotonic(), ids)
+        return ids
+
+    def _current(self, bind, model):
+        entry = self._entry(bind, model)
+        if entry is None or time.monotonic() - entry[0] > self.refresh_seconds:
+            return None
+        return entry[1]
+
+    # Answered from memory alone; False means contains() has to be asked
+    def known(self, session: Session, model, key: int) -> bool:
+        ids = self._current(session.get_bind(), model)
+        return ids is not None and key in ids
+
+    def contains(self, session: Session, model, key: int) -> bool:
+        bind = session.get_bind()
+        ids = self._current(bind, model)
+        if ids is None:
+            ids = self._load(bind, model)
+        if key in ids:
+            return True
+        with bind.connect() as conn:
+            found = conn.execute(select(model.id).where(model.id == key)).first() is not None
+        if found:
+            ids.add(key)
+        return found
+
+    def add(self, session: Session, model, key: int):
+        entry = self._entry(session.get_bind(), model)
+        if entry is not None:
+            entry[1].add(key)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+reference_index = ReferenceIndex(refresh_seconds=settings.reference_index_refresh_seconds)
+
+
+# references maps body field names to the model each one points at
+def references_known(session: Session, body, references: dict) -> bool:
+    return all(
+        getattr(body, field) is None or reference_index.known(session, model, getattr(body, field))
+        for field, model in references.items()
+    )
+
+
+def check_references(session: Session, body, references: dict):
+    errors = []
+    for field, model in references.items():
+        value = getattr(body, field)
+        if value is not None and not reference_index.contains(session, model, value):
+            errors.append({
+                "type": "foreign_key",
+                "loc": ("body", field),
+                "msg": f"{model.__name__} {value} does not exist",
+                "input": value,
+            })
+    if errors:
+        raise RequestValidationError(errors)
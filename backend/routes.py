@@ -1,44 +1,208 @@
-from typing import List, Annotated
-from fastapi import APIRouter, Response, status, Depends, Body
-from fastapi.responses import JSONResponse
+import base64
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime
+from functools import lru_cache
+from typing import List, Annotated, Literal, Optional
+from fastapi import (
+    APIRouter, Request, Response, status, Depends, Body, Header, Query, HTTPException, WebSocket,
+    WebSocketDisconnect
+)
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import TypeAdapter
 
-from sqlmodel import Session
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, joinedload
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from models import (
     Student, StudentRead, Department, DepartmentRead, User, UserRead,
     Course, CourseRead, AttendanceLog, AttendanceLogRead, CourseAdd,
-    AttendanceLogCreate, UserCreate, StudentCreate
+    AttendanceLogCreate, UserCreate, UserLogin, StudentCreate, AttendanceLogBulkCreate,
+    AttendanceLogBulkResult, AttendanceSummary, AttendanceSummaryRead, SearchResult,
+    RosterEntry, AttendanceRate, AttendanceRanking, DepartmentAttendance
     )
-from db import get_session
+from archive import TERM_PATTERN, archives, attendance_log_source, term_bounds, term_of
+from attendance import attendance_row, upsert_attendance_logs
+from cache import response_cache
+from config import settings
+from credentials import password_hasher
+from db import get_session, get_async_session
+from feed import attendance_feed
+from importer import READERS, import_rows
+from references import check_references, reference_index, references_known
+from instrumentation import InstrumentedRoute, metrics, track_serialization
+from search import KINDS, SEARCH_QUERY, match_expression
+from serializers import ORJSONResponse, serialization_plan
+from write_queue import attendance_write_queue
 
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
 @router.get("/")
 async def read_root():
     return JSONResponse(content={"message": "Hello, World!"}, status_code=200)
 
+# Loader options for the nested *Read schemas, so serializing a list never
+# falls back to a lazy load per row.
+STUDENT_READ_OPTIONS = (
+    joinedload(Student.user),
+    joinedload(Student.department),
+)
+COURSE_READ_OPTIONS = (
+    joinedload(Course.department),
+)
+
+
+# log is AttendanceLog or the union over its partitions from archive.py
+def attendance_log_read_options(log) -> tuple:
+    return (
+        joinedload(log.student).joinedload(Student.user),
+        joinedload(log.student).joinedload(Student.department),
+        joinedload(log.course).joinedload(Course.department),
+    )
+
+
+ATTENDANCE_LOG_READ_OPTIONS = attendance_log_read_options(AttendanceLog)
+
+
+@lru_cache
+def list_adapter(read_model) -> TypeAdapter:
+    return TypeAdapter(List[read_model])
+
+
+# With settings.fast_serialization the list routes select just the read
+# model's columns and encode plain dicts with orjson, instead of hydrating
+# ORM objects and validating each one against the response model.
+async def fetch_read_rows(session: AsyncSession, read_model, entity, *where, order_by, limit=None):
+    plan = serialization_plan(read_model, entity)
+    statement = plan.select().where(*where).order_by(*order_by)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return plan.rows(await session.execute(statement))
+
+
+# Collection ETags come from the write generation the POST routes bump, so
+# a matching If-None-Match is answered without touching the database.
+def not_modified(request: Request, key: str) -> Optional[Response]:
+    etag = response_cache.etag(key)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return None
+
+
+async def cached_list_response(
+    request: Request, session: AsyncSession, key: str, entity, read_model, options=()
+) -> Response:
+    if (response := not_modified(request, key)) is not None:
+        return response
+    generation = response_cache.generation(key)
+    body = response_cache.get(key)
+    if body is None:
+        if settings.fast_serialization:
+            rows = await fetch_read_rows(session, read_model, entity, order_by=[entity.id])
+            with track_serialization():
+                body = orjson.dumps(rows)
+        else:
+            rows = (await session.scalars(
+                select(entity).options(*options).order_by(entity.id)
+            )).all()
+            adapter = list_adapter(read_model)
+            with track_serialization():
+                body = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+        response_cache.set(key, body, generation)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": response_cache.etag(key, generation)},
+    )
+
+
 @router.get("/students", response_model=List[StudentRead])
-async def read_students(session: Session = Depends(get_session)):
-    students = session.query(Student).all()
-    return students
+async def read_students(
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_async_session),
+):
+    if (not_modified_response := not_modified(request, "students")) is not None:
+        return not_modified_response
+    etag = response_cache.etag("students")
+    if settings.fast_serialization:
+        rows = await fetch_read_rows(session, StudentRead, Student, order_by=[Student.id])
+        return ORJSONResponse(rows, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    students = await session.scalars(
+        select(Student).options(*STUDENT_READ_OPTIONS).order_by(Student.id)
+    )
+    return students.all()
 
 
 @router.get("/departments", response_model=List[DepartmentRead])
-async def read_departments(session: Session = Depends(get_session)):
-    departments = session.query(Department).all()
-    return departments
+async def read_departments(
+    request: Request, session: AsyncSession = Depends(get_async_session)
+):
+    return await cached_list_response(request, session, "departments", Department, DepartmentRead)
 
 @router.get("/users", response_model=List[UserRead])
-async def read_users(session: Session = Depends(get_session)):
-    users = session.query(User).all()
-    return users
+async def read_users(request: Request, session: AsyncSession = Depends(get_async_session)):
+    return await cached_list_response(request, session, "users", User, UserRead)
 
 
 @router.get("/courses", response_model=List[CourseRead])
-async def read_courses(session: Session = Depends(get_session)):
-    courses = session.query(Course).all()
-    return courses
+async def read_courses(request: Request, session: AsyncSession = Depends(get_async_session)):
+    return await cached_list_response(
+        request, session, "courses", Course, CourseRead, COURSE_READ_OPTIONS
+    )
+
+
+@router.get("/search", response_model=List[SearchResult])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[Literal["user", "course"]] = None,
+    limit: int = Query(20, ge=1, le=100),
+    session: AsyncSession = Depends(get_async_session),
+):
+    if session.bind.dialect.name != "sqlite":
+        raise HTTPException(status_code=501, detail="Search needs SQLite FTS5")
+    match = match_expression(q)
+    if not match:
+        return ORJSONResponse([])
+    rows = await session.execute(
+        SEARCH_QUERY, {"match": match, "kind": KINDS.get(kind), "limit": limit}
+    )
+    kinds = {value: name for name, value in KINDS.items()}
+    return ORJSONResponse([
+        {
+            "kind": kinds[row.kind],
+            "id": row.ref_id,
+            "name": row.name,
+            "username": row.username,
+            "email": row.email,
+            "student_id": row.student_id,
+            "score": -row.score,
+        }
+        for row in rows
+    ])
+
+
+@router.get("/cache/stats")
+async def read_cache_stats():
+    return response_cache.stats()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @router.post("/departments", response_model=DepartmentRead)
 def add_department(
@@ -48,40 +212,543 @@ def add_department(
 ):
     session.add(department)
     session.commit()
+    response_cache.invalidate("departments")
     session.refresh(department)
+    reference_index.add(session, Department, department.id)
     return department
 
 
+# Foreign keys of each create payload, checked against the reference index
+COURSE_REFERENCES = {"department_id": Department}
+STUDENT_REFERENCES = {"user_id": User, "department_id": Department}
+ATTENDANCE_LOG_REFERENCES = {"student_id": Student, "course_id": Course}
+
+
 @router.post("/course", response_model=CourseRead)
 def add_course(
     *,
     session: Annotated[Session, Depends(get_session)],
     course_data: CourseAdd = Body(...)
 ):
+    check_references(session, course_data, COURSE_REFERENCES)
     course = Course.from_orm(course_data)
     session.add(course)
     session.commit()
+    response_cache.invalidate("courses")
     session.refresh(course)
+    reference_index.add(session, Course, course.id)
     return course
 
 
+def encode_cursor(log_id: int) -> str:
+    return base64.urlsafe_b64encode(str(log_id).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Resolves the partitions a request's session date / term filter touches
+# and returns that source with the filters expressed against it.
+async def attendance_log_query(
+    student_id: Optional[int] = None,
+    course_id: Optional[int] = None,
+    present: Optional[bool] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    session_date_from: Optional[date] = None,
+    session_date_to: Optional[date] = None,
+    term: Optional[str] = Query(None, pattern=TERM_PATTERN),
+) -> tuple:
+    if term is not None:
+        term_start, term_end = term_bounds(term)
+        session_date_from = max(filter(None, (session_date_from, term_start)))
+        session_date_to = min(filter(None, (session_date_to, term_end)))
+    log = attendance_log_source(session_date_from, session_date_to)
+
+    filters = []
+    if student_id is not None:
+        filters.append(log.student_id == student_id)
+    if course_id is not None:
+        filters.append(log.course_id == course_id)
+    if present is not None:
+        filters.append(log.present == present)
+    # updated_at is stored as str(datetime), so ISO strings compare in order
+    if date_from is not None:
+        filters.append(log.updated_at >= date_from.isoformat(" "))
+    if date_to is not None:
+        filters.append(log.updated_at < date_to.isoformat(" "))
+    if session_date_from is not None:
+        filters.append(log.session_date >= session_date_from)
+    if session_date_to is not None:
+        filters.append(log.session_date < session_date_to)
+    return log, filters
+
+
 @router.get("/attendance-log", response_model=List[AttendanceLogRead])
-async def read_attendance_log(session: Session = Depends(get_session)):
-    attendance_logs = session.query(AttendanceLog).all()
+async def read_attendance_log(
+    response: Response,
+    session: AsyncSession = Depends(get_async_session),
+    query: tuple = Depends(attendance_log_query),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    log, filters = query
+    if cursor is not None:
+        filters = [*filters, log.id > decode_cursor(cursor)]
+    # Pages follow id: an upsert rewrites updated_at, which would move a
+    # re-marked row behind a client's cursor and hand it out twice
+    order_by = [log.id]
+
+    if settings.fast_serialization:
+        rows = await fetch_read_rows(
+            session, AttendanceLogRead, log, *filters, order_by=order_by, limit=limit + 1
+        )
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers["X-Next-Cursor"] = encode_cursor(rows[-1]["id"])
+        return ORJSONResponse(rows, headers=headers)
+
+    result = await session.scalars(
+        select(log)
+        .options(*attendance_log_read_options(log))
+        .where(*filters)
+        .order_by(*order_by)
+        .limit(limit + 1)
+    )
+    attendance_logs = result.all()
+    if len(attendance_logs) > limit:
+        attendance_logs = attendance_logs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(attendance_logs[-1].id)
     return attendance_logs
 
 
+EXPORT_BATCH_SIZE = 1000
+
+StudentDepartment = aliased(Department)
+CourseDepartment = aliased(Department)
+
+@lru_cache(maxsize=64)
+def export_columns(log) -> tuple:
+    return (
+        log.id,
+        log.updated_at,
+        log.submitted_by,
+        log.present,
+        log.student_id,
+        Student.class_id,
+        User.full_name.label("student_name"),
+        User.username,
+        User.email,
+        StudentDepartment.department_name.label("student_department"),
+        log.course_id,
+        Course.course_name,
+        Course.semester,
+        CourseDepartment.department_name.label("course_department"),
+    )
+
+
+EXPORT_COLUMNS = export_columns(AttendanceLog)
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+
+def iter_ndjson(rows):
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(row._asdict(), default=str))
+        if len(buffer) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(buffer) + "\n"
+            buffer.clear()
+    if buffer:
+        yield "\n".join(buffer) + "\n"
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+@router.get("/attendance-log/export")
+def export_attendance_log(
+    session: Session = Depends(get_session),
+    query: tuple = Depends(attendance_log_query),
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+):
+    log, filters = query
+    rows = (
+        session.query(*export_columns(log))
+        .select_from(log)
+        .join(Student, log.student_id == Student.id)
+        .join(User, Student.user_id == User.id)
+        .join(StudentDepartment, Student.department_id == StudentDepartment.id)
+        .join(Course, log.course_id == Course.id)
+        .join(CourseDepartment, Course.department_id == CourseDepartment.id)
+        .filter(*filters)
+        .order_by(log.id)
+        .yield_per(EXPORT_BATCH_SIZE)
+    )
+    if export_format == "csv":
+        return StreamingResponse(
+            iter_csv(rows),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=attendance-log.csv"},
+        )
+    return StreamingResponse(iter_ndjson(rows), media_type="application/x-ndjson")
+
+
+# Change feed subscriptions: events for the course, the class, or both;
+# with neither, every attendance change
+def feed_topics(course_id: Optional[int] = None, class_id: Optional[int] = None) -> frozenset:
+    topics = set()
+    if course_id is not None:
+        topics.add(f"course:{course_id}")
+    if class_id is not None:
+        topics.add(f"class:{class_id}")
+    return frozenset(topics)
+
+
+def sse_message(event: dict) -> bytes:
+    return b"id: %s\nevent: %s\ndata: %s\n\n" % (
+        event["id"].encode(), event["event"].encode(), orjson.dumps(event["data"])
+    )
+
+
+def feed_message(event: dict) -> str:
+    return orjson.dumps({"id": event["id"], "event": event["event"], "data": event["data"]}).decode()
+
+
+async def iter_sse(subscription, lost: bool):
+    try:
+        if lost:
+            yield sse_message(attendance_feed.reset_event())
+        while True:
+            event = await subscription.next(settings.feed_heartbeat_seconds)
+            yield b": keepalive\n\n" if event is None else sse_message(event)
+    finally:
+        attendance_feed.unsubscribe(subscription)
+
+
+# A "reset" event means the events since Last-Event-ID are gone (or came
+# from another process): reload the state, then keep following the feed
+@router.get("/attendance-log/feed")
+async def attendance_log_feed(
+    topics: frozenset = Depends(feed_topics),
+    last_event_id: Annotated[Optional[str], Header()] = None,
+):
+    subscription, lost = attendance_feed.subscribe(topics, last_event_id)
+    return StreamingResponse(
+        iter_sse(subscription, lost),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/attendance-log/feed/ws")
+async def attendance_log_feed_ws(
+    websocket: WebSocket,
+    topics: frozenset = Depends(feed_topics),
+    last_event_id: Optional[str] = None,
+):
+    await websocket.accept()
+    subscription, lost = attendance_feed.subscribe(topics, last_event_id)
+    try:
+        if lost:
+            await websocket.send_text(feed_message(attendance_feed.reset_event()))
+        while True:
+            event = await subscription.next(settings.feed_heartbeat_seconds)
+            if event is None:
+                await websocket.send_text('{"event":"keepalive"}')
+            else:
+                await websocket.send_text(feed_message(event))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        attendance_feed.unsubscribe(subscription)
+
+
+# Archived terms are read-only: their rows no longer live in attendancelog,
+# so an upsert there would add a second mark instead of replacing one
+def reject_archived_term(session_date: date):
+    term = archives.archived_term(session_date)
+    if term is not None:
+        raise HTTPException(status_code=409, detail=f"Term {term} is archived")
+
+
+def store_attendance_log(session: Session, row: dict) -> int:
+    [log_id] = upsert_attendance_logs(session, [row])
+    session.commit()
+    return log_id
+
+
 @router.post("/attendance-log", response_model=AttendanceLogRead)
-def add_attendance_log(
+async def add_attendance_log(
     *,
     session: Annotated[Session, Depends(get_session)],
-    attendance_data: AttendanceLogCreate = Body(...)
+    async_session: Annotated[AsyncSession, Depends(get_async_session)],
+    attendance_data: AttendanceLogCreate = Body(...),
+    idempotency_key: Annotated[Optional[str], Header()] = None,
 ):
-    attendance_log = AttendanceLog.from_orm(attendance_data)
-    session.add(attendance_log)
-    session.commit()
-    session.refresh(attendance_log)
-    return attendance_log
+    # Anything the index cannot answer from memory goes to the database;
+    # keep that off the loop
+    if not references_known(session, attendance_data, ATTENDANCE_LOG_REFERENCES):
+        await run_in_threadpool(check_references, session, attendance_data, ATTENDANCE_LOG_REFERENCES)
+    row = attendance_row(**attendance_data.model_dump(), idempotency_key=idempotency_key)
+    reject_archived_term(row["session_date"])
+    try:
+        if attendance_write_queue.running:
+            log_id = await attendance_write_queue.submit(row)
+        else:
+            log_id = await run_in_threadpool(store_attendance_log, session, row)
+    except IntegrityError:
+        await run_in_threadpool(session.rollback)
+        raise HTTPException(
+            status_code=409, detail="Idempotency-Key already used for a different attendance record"
+        )
+    response_cache.invalidate(f"roster-course:{row['course_id']}")
+    log = await async_session.get(AttendanceLog, log_id, options=ATTENDANCE_LOG_READ_OPTIONS)
+    attendance_feed.publish_mark(log_id, row, log.course.class_id if log.course else None)
+    return log
+
+
+@router.post("/attendance-log/bulk", response_model=List[AttendanceLogBulkResult])
+def add_attendance_log_bulk(
+    *,
+    session: Annotated[Session, Depends(get_session)],
+    roll_call: AttendanceLogBulkCreate = Body(...)
+):
+    course = (
+        session.query(Course.id)
+        .filter(Course.id == roll_call.course_id, Course.class_id == roll_call.class_id)
+        .first()
+    )
+    if course is None:
+        raise HTTPException(status_code=404, detail="Course not found for class")
+
+    session_date = roll_call.session_date or date.today()
+    reject_archived_term(session_date)
+    student_ids = {entry.student_id for entry in roll_call.entries}
+    student_classes = dict(
+        session.query(Student.id, Student.class_id).filter(Student.id.in_(student_ids)).all()
+    )
+    already_marked = {
+        student_id for (student_id,) in session.query(AttendanceLog.student_id).filter(
+            AttendanceLog.course_id == roll_call.course_id,
+            AttendanceLog.session_date == session_date,
+            AttendanceLog.student_id.in_(student_ids),
+        )
+    }
+
+    results = []
+    rows = []
+    seen = set()
+    now = datetime.now()
+    for entry in roll_call.entries:
+        result = AttendanceLogBulkResult(
+            student_id=entry.student_id, present=entry.present, status="rejected"
+        )
+        results.append(result)
+        if entry.student_id in seen:
+            result.detail = "Duplicate entry"
+        elif entry.student_id not in student_classes:
+            result.detail = "Student not found"
+        elif student_classes[entry.student_id] != roll_call.class_id:
+            result.detail = "Student not in class"
+        else:
+            result.status = "updated" if entry.student_id in already_marked else "created"
+            rows.append(attendance_row(
+                roll_call.submitted_by,
+                entry.student_id,
+                roll_call.course_id,
+                entry.present,
+                session_date=session_date,
+                updated_at=now,
+            ))
+        seen.add(entry.student_id)
+
+    if rows:
+        ids = iter(upsert_attendance_logs(session, rows))
+        session.commit()
+        response_cache.invalidate(f"roster-course:{roll_call.course_id}")
+        for result in results:
+            if result.status != "rejected":
+                result.id = next(ids)
+        for row, result in zip(rows, (result for result in results if result.status != "rejected")):
+            attendance_feed.publish_mark(result.id, row, roll_call.class_id)
+    return results
+
+
+# A roster depends on the class's students and the course's marks, so its
+# cache key carries a generation for each; bumping either one retires the
+# entry, which then ages out of the LRU.
+def roster_cache_key(class_id: int, course_id: int) -> str:
+    return (
+        f"roster:{class_id}:{course_id}:"
+        f"{response_cache.generation(f'roster-class:{class_id}')}:"
+        f"{response_cache.generation(f'roster-course:{course_id}')}"
+    )
+
+
+LatestLog = aliased(AttendanceLog)
+ROSTER_COLUMNS = (
+    Student.id.label("student_id"),
+    User.id.label("user_id"),
+    User.submitted_by,
+    User.updated_at,
+    User.user_type,
+    User.full_name,
+    User.email,
+    LatestLog.session_date,
+    LatestLog.present,
+    LatestLog.updated_at.label("marked_at"),
+)
+
+
+def roster_query(class_id: int, course_id: int):
+    latest_log_id = (
+        select(AttendanceLog.id)
+        .where(AttendanceLog.student_id == Student.id, AttendanceLog.course_id == Course.id)
+        .order_by(AttendanceLog.session_date.desc(), AttendanceLog.id.desc())
+        .limit(1)
+        .correlate(Student, Course)
+        .scalar_subquery()
+    )
+    # Starting from the course keeps it to one query: no rows means the
+    # course is not taught to this class, one all-NULL row an empty class
+    return (
+        select(*ROSTER_COLUMNS)
+        .select_from(Course)
+        .outerjoin(Student, Student.class_id == Course.class_id)
+        .outerjoin(User, User.id == Student.user_id)
+        .outerjoin(LatestLog, LatestLog.id == latest_log_id)
+        .where(Course.id == course_id, Course.class_id == class_id)
+        .order_by(User.full_name, Student.id)
+    )
+
+
+@router.get("/classes/{class_id}/roster", response_model=List[RosterEntry])
+async def read_class_roster(
+    class_id: int,
+    course_id: int,
+    session: AsyncSession = Depends(get_async_session),
+):
+    key = roster_cache_key(class_id, course_id)
+    generation = response_cache.generation(key)
+    body = response_cache.get(key)
+    if body is None:
+        rows = (await session.execute(roster_query(class_id, course_id))).all()
+        if not rows:
+            raise HTTPException(status_code=404, detail="Course not found for class")
+        with track_serialization():
+            body = orjson.dumps([
+                {
+                    "student_id": row.student_id,
+                    "user": {
+                        "id": row.user_id,
+                        "submitted_by": row.submitted_by,
+                        "updated_at": row.updated_at,
+                        "user_type": row.user_type,
+                        "full_name": row.full_name,
+                        "email": row.email,
+                    },
+                    "latest_attendance": None if row.session_date is None else {
+                        "session_date": row.session_date,
+                        "present": row.present,
+                        "updated_at": row.marked_at,
+                    },
+                }
+                for row in rows
+                if row.student_id is not None
+            ])
+        response_cache.set(key, body, generation)
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/students/{student_id}/attendance-summary", response_model=List[AttendanceSummaryRead])
+async def read_student_attendance_summary(
+    student_id: int, session: AsyncSession = Depends(get_async_session)
+):
+    if await session.get(Student, student_id) is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    summaries = await session.scalars(
+        select(AttendanceSummary)
+        .where(AttendanceSummary.student_id == student_id)
+        .order_by(AttendanceSummary.course_id)
+    )
+    return summaries.all()
+
+
+@router.get("/courses/{course_id}/attendance-summary", response_model=List[AttendanceSummaryRead])
+async def read_course_attendance_summary(
+    course_id: int, session: AsyncSession = Depends(get_async_session)
+):
+    if await session.get(Course, course_id) is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    summaries = await session.scalars(
+        select(AttendanceSummary)
+        .where(AttendanceSummary.course_id == course_id)
+        .order_by(AttendanceSummary.student_id)
+    )
+    return summaries.all()
+
+
+# Imported on first use, which keeps NumPy out of worker startup
+def analytics_matrices():
+    from analytics import attendance_matrices
+    return attendance_matrices
+
+
+# The analytics routes are sync: matrix refreshes and the NumPy work run in
+# the threadpool rather than on the event loop. term defaults to the
+# current one.
+def analytics_term(term: Optional[str] = Query(None, pattern=TERM_PATTERN)) -> str:
+    return term or term_of(date.today())
+
+
+@router.get("/analytics/below-threshold", response_model=List[AttendanceRate])
+def read_attendance_below_threshold(
+    session: Annotated[Session, Depends(get_session)],
+    term: str = Depends(analytics_term),
+    threshold: float = Query(0.75, ge=0, le=1),
+    min_sessions: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=10000),
+):
+    matrix = analytics_matrices().get(session, term)
+    return ORJSONResponse(matrix.below_threshold(threshold, min_sessions, limit))
+
+
+@router.get("/analytics/ranking", response_model=List[AttendanceRanking])
+def read_attendance_ranking(
+    session: Annotated[Session, Depends(get_session)],
+    term: str = Depends(analytics_term),
+    by: Literal["student", "course"] = "student",
+    order: Literal["asc", "desc"] = "asc",
+    min_sessions: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=10000),
+):
+    matrix = analytics_matrices().get(session, term)
+    return ORJSONResponse(matrix.ranking(by, order == "desc", min_sessions, limit))
+
+
+@router.get("/analytics/departments", response_model=List[DepartmentAttendance])
+def read_department_attendance(
+    session: Annotated[Session, Depends(get_session)],
+    term: str = Depends(analytics_term),
+    threshold: float = Query(0.75, ge=0, le=1),
+):
+    matrix = analytics_matrices().get(session, term)
+    return ORJSONResponse(matrix.department_rollup(threshold))
 
 
 @router.post("/student", response_model=StudentRead)
@@ -90,20 +757,86 @@ def add_student(
     session: Annotated[Session, Depends(get_session)],
     student_data: StudentCreate = Body(...)
 ):
+    check_references(session, student_data, STUDENT_REFERENCES)
     student = Student.from_orm(student_data)
     session.add(student)
     session.commit()
+    response_cache.invalidate("students", f"roster-class:{student.class_id}")
     session.refresh(student)
+    reference_index.add(session, Student, student.id)
     return student
 
+def store_user(session: Session, user_data: UserCreate, password_hash: str) -> User:
+    user = User.from_orm(user_data)
+    user.password = password_hash
+    session.add(user)
+    session.commit()
+    response_cache.invalidate("users")
+    session.refresh(user)
+    reference_index.add(session, User, user.id)
+    return user
+
+
 @router.post("/users", response_model=UserRead)
-def add_user(
+async def add_user(
     *,
     session: Annotated[Session, Depends(get_session)],
     user_data: UserCreate = Body(...)
 ):
-    user = User.from_orm(user_data)
-    session.add(user)
+    # Hashed in the process pool; the event loop serves other requests meanwhile
+    password_hash = await password_hasher.hash(user_data.password)
+    return await run_in_threadpool(store_user, session, user_data, password_hash)
+
+
+def update_password(session: Session, user_id: int, password_hash: str):
+    session.execute(update(User).where(User.id == user_id).values(password=password_hash))
     session.commit()
-    session.refresh(user)
-    return user
\ No newline at end of file
+
+
+@router.post("/login", response_model=UserRead)
+async def login(
+    *,
+    session: Annotated[Session, Depends(get_session)],
+    async_session: Annotated[AsyncSession, Depends(get_async_session)],
+    credentials: UserLogin = Body(...)
+):
+    user = await async_session.scalar(select(User).where(User.username == credentials.username))
+    if not await password_hasher.verify(credentials.password, user.password if user else None):
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    # Plaintext rows and ones hashed with an older cost are upgraded on login
+    if password_hasher.needs_rehash(user.password):
+        password_hash = await password_hasher.hash(credentials.password)
+        await run_in_threadpool(update_password, session, user.id, password_hash)
+    return user
+
+
+# Uploads past this size are spooled to a temporary file
+IMPORT_SPOOL_BYTES = 1 << 20
+
+
+def iter_import_records(records, stream):
+    try:
+        for record in records:
+            yield orjson.dumps(record, default=str) + b"\n"
+    finally:
+        stream.close()
+
+
+# Streams back NDJSON: one line per rejected row, a progress line after
+# each committed chunk and a final line with "done": true
+@router.post("/import/{kind}")
+async def import_records(
+    kind: Literal["users", "students", "courses"],
+    request: Request,
+    session: Annotated[Session, Depends(get_session)],
+    import_format: Optional[Literal["csv", "ndjson"]] = Query(None, alias="format"),
+):
+    if import_format is None:
+        import_format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    upload = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    async for chunk in request.stream():
+        upload.write(chunk)
+    upload.seek(0)
+    stream = io.TextIOWrapper(upload, encoding="utf-8", newline="")
+    records = import_rows(session, kind, READERS[import_format](stream), settings.import_chunk_size)
+    return StreamingResponse(iter_import_records(records, stream), media_type="application/x-ndjson")
\ No newline at end of file
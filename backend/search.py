@@ -0,0 +1,88 @@
+import re
+
+from sqlalchemy import DDL, event, inspect, text
+from sqlmodel import SQLModel
+
+# One FTS5 table covers users and courses. The row's kind is folded into its
+# rowid (users even, courses odd) so the triggers address rows directly
+# instead of scanning an UNINDEXED kind column.
+SEARCH_TABLE = "search_index"
+KINDS = {"user": 0, "course": 1}
+# bm25 weights for (name, username, email): a name hit outranks an email hit
+RANK_WEIGHTS = (10.0, 5.0, 1.0)
+
+SEARCH_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        name, username, email,
+        tokenize = "unicode61 remove_diacritics 2",
+        prefix = '2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_user_insert AFTER INSERT ON "user" BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, name, username, email)
+        VALUES (new.id * 2, new.full_name, new.username, new.email);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_user_update
+    AFTER UPDATE OF full_name, username, email ON "user" BEGIN
+        UPDATE {SEARCH_TABLE} SET name = new.full_name, username = new.username, email = new.email
+        WHERE rowid = old.id * 2;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_user_delete AFTER DELETE ON "user" BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_course_insert AFTER INSERT ON course BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, name) VALUES (new.id * 2 + 1, new.course_name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_course_update AFTER UPDATE OF course_name ON course BEGIN
+        UPDATE {SEARCH_TABLE} SET name = new.course_name WHERE rowid = old.id * 2 + 1;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS search_course_delete AFTER DELETE ON course BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2 + 1;
+    END""",
+]
+
+# Created and dropped along with the tables, wherever create_all runs
+for statement in SEARCH_DDL:
+    event.listen(SQLModel.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(
+    SQLModel.metadata, "before_drop",
+    DDL(f"DROP TABLE IF EXISTS {SEARCH_TABLE}").execute_if(dialect="sqlite"),
+)
+
+
+def has_search_index(engine) -> bool:
+    return inspect(engine).has_table(SEARCH_TABLE)
+
+
+def rebuild_search_index(session):
+    session.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    session.execute(text(
+        f"""INSERT INTO {SEARCH_TABLE} (rowid, name, username, email)
+        SELECT id * 2, full_name, username, email FROM "user" """
+    ))
+    session.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, name) SELECT id * 2 + 1, course_name FROM course"
+    ))
+
+
+def match_expression(q: str) -> str:
+    # Every word must match as a prefix. Quoting each token keeps FTS5
+    # operators and punctuation in user input from being parsed as syntax.
+    return " ".join(f'"{token}"*' for token in re.findall(r"\w+", q))
+
+
+SEARCH_QUERY = text(f"""
+    SELECT hit.rowid % 2 AS kind, hit.rowid / 2 AS ref_id, hit.name, hit.username, hit.email,
+           hit.score,
+           CASE WHEN hit.rowid % 2 = 0 THEN
+               (SELECT min(student.id) FROM student WHERE student.user_id = hit.rowid / 2)
+           END AS student_id
+    FROM (
+        SELECT rowid, name, username, email,
+               bm25({SEARCH_TABLE}, {", ".join(map(str, RANK_WEIGHTS))}) AS score
+        FROM {SEARCH_TABLE}
+        WHERE {SEARCH_TABLE} MATCH :match AND (:kind IS NULL OR rowid % 2 = :kind)
+        ORDER BY score
+        LIMIT :limit
+    ) AS hit
+    ORDER BY hit.score
+""")
@@ -0,0 +1,83 @@
+import typing
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable
+
+import orjson
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from sqlmodel import SQLModel
+
+from instrumentation import track_serialization
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        with track_serialization():
+            return orjson.dumps(content)
+
+
+def to_datetime(value):
+    # updated_at is stored as str(datetime) even where a read model declares datetime
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def nested_model(annotation):
+    for candidate in (annotation, *typing.get_args(annotation)):
+        if isinstance(candidate, type) and issubclass(candidate, SQLModel):
+            return candidate
+    return None
+
+
+def is_datetime(annotation) -> bool:
+    return annotation is datetime or datetime in typing.get_args(annotation)
+
+
+class SerializationPlan:
+    # Selects exactly the columns a read model exposes, joining one alias per
+    # nested model, and rebuilds the nested dicts straight from result tuples
+    # so list responses skip ORM hydration and per-object validation.
+
+    def __init__(self, read_model: type[SQLModel], entity):
+        self.columns = []
+        self.joins = []
+        self.root = entity
+        self.build = self._plan(read_model, entity)
+
+    def _plan(self, read_model, entity) -> Callable[[tuple], dict]:
+        fields = []
+        for name, field in read_model.model_fields.items():
+            nested = nested_model(field.annotation)
+            if nested is not None:
+                relationship = getattr(entity, name)
+                target = aliased(relationship.property.mapper.class_)
+                self.joins.append((target, relationship.of_type(target)))
+                fields.append((name, self._plan(nested, target)))
+                continue
+            index = len(self.columns)
+            self.columns.append(getattr(entity, name))
+            if is_datetime(field.annotation):
+                fields.append((name, lambda row, i=index: to_datetime(row[i])))
+            else:
+                fields.append((name, lambda row, i=index: row[i]))
+
+        def build(row) -> dict:
+            return {name: getter(row) for name, getter in fields}
+
+        return build
+
+    def select(self):
+        statement = select(*self.columns).select_from(self.root)
+        for target, onclause in self.joins:
+            statement = statement.join(target, onclause)
+        return statement
+
+    def rows(self, result) -> list[dict]:
+        with track_serialization():
+            return [self.build(row) for row in result]
+
+
+@lru_cache
+def serialization_plan(read_model: type[SQLModel], entity) -> SerializationPlan:
+    return SerializationPlan(read_model, entity)
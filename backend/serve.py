@@ -0,0 +1,51 @@
+"""Multi-worker launcher.
+
+Creates and upgrades the schema once in this process, then starts uvicorn
+workers that skip that step. The workers share cache invalidations through
+a memory-mapped generation file, so a write answered by one worker retires
+the cached responses and ETags of all of them:
+
+    python serve.py --workers 4 --host 0.0.0.0 --port 8000
+
+The file lives in a temporary directory unless ``CACHE_BUS_PATH`` names
+one; importer.py run with the same setting retires the workers' cached
+lists as it imports.
+"""
+import argparse
+import os
+import tempfile
+
+import uvicorn
+
+from cache import SharedGenerations
+from config import settings
+from db import ensure_schema, engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    ensure_schema()
+    # Workers open their own pools; nothing of this process's is inherited
+    engine.dispose()
+
+    with tempfile.TemporaryDirectory(prefix="attendance-") as runtime:
+        path = settings.cache_bus_path or os.path.join(runtime, "cache-generations")
+        SharedGenerations.create(path, settings.cache_bus_slots).close()
+        # Spawned workers build their settings from the environment; a single
+        # worker runs in this process and reads the settings object directly
+        os.environ["SCHEMA_SETUP"] = "false"
+        os.environ["CACHE_BUS_PATH"] = path
+        settings.schema_setup = False
+        settings.cache_bus_path = path
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers,
+                    log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
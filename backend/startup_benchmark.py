@@ -0,0 +1,97 @@
+"""Cold-start benchmark: how long a fresh uvicorn worker takes to serve.
+
+Starts the app in a new process several times over a copy of the database
+and reports, per mode, the median time from spawning the process to the
+first successful request and the latency of the first real query:
+
+    python startup_benchmark.py --database assessment.db --trials 7
+    python startup_benchmark.py --app-dir ../../before/backend --mode full
+
+``full`` re-runs the schema setup and opens no connections before the
+first request; ``fast`` is the default configuration. ``--app-dir`` points
+at another checkout, to compare against an earlier revision.
+"""
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+MODES = {
+    "full": {"SCHEMA_VERSION_CHECK": "false", "DB_POOL_PREWARM": "0"},
+    "fast": {},
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure(app_dir: str, database: str, env: dict, timeout: float) -> dict:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=app_dir,
+        env={**os.environ, "DATABASE_URL": f"sqlite:///{database}", **env},
+    )
+    started = time.perf_counter()
+    try:
+        with httpx.Client(base_url=base, timeout=timeout) as client:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"server exited with {process.returncode}")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError("server did not come up")
+                try:
+                    if client.get("/").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.005)
+            ready = time.perf_counter() - started
+            request_started = time.perf_counter()
+            # A bounded page, so the probe costs the same whatever the database holds
+            client.get("/attendance-log", params={"limit": 10}).raise_for_status()
+            first_query = time.perf_counter() - request_started
+    finally:
+        process.terminate()
+        process.wait()
+    return {"ready_ms": ready * 1000, "first_query_ms": first_query * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="assessment.db", help="SQLite file to copy for each trial")
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--mode", action="append", choices=sorted(MODES), help="default: all")
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="startup-") as scratch:
+        database = os.path.join(scratch, "startup.db")
+        for mode in args.mode or list(MODES):
+            samples = []
+            for _ in range(args.trials):
+                # Every trial starts from the same file, so a schema version
+                # written by one run does not carry over to the next mode
+                shutil.copyfile(args.database, database)
+                if mode == "fast":
+                    # What a worker sees once the first one has set the schema up
+                    measure(args.app_dir, database, MODES[mode], args.timeout)
+                samples.append(measure(args.app_dir, database, MODES[mode], args.timeout))
+            ready = statistics.median(sample["ready_ms"] for sample in samples)
+            first_query = statistics.median(sample["first_query_ms"] for sample in samples)
+            print(f"{mode:5} ready {ready:8.1f} ms  first query {first_query:7.1f} ms  ({args.trials} trials)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
-from datetime import datetime
+from datetime import date, datetime
 
 import pytest
-from sqlmodel import Session, select
+from sqlmodel import Session, SQLModel, select
 
-from models import User, Department, Course, Student, AttendanceLog
+from sqlalchemy import event, text
+
+from archive import ArchiveRegistry, archive_table
+from cache import ResponseCache, SharedGenerations
+from config import Settings
+import db
+from db import create_db_engine, schema_fingerprint, schema_version, stored_schema_version
+from aggregates import rebuild_attendance_summary
+from attendance import attendance_row, upsert_attendance_logs
+from explain import full_scans
+from references import ReferenceIndex
+from search import SEARCH_QUERY, match_expression, rebuild_search_index
+from models import User, Department, Course, Student, AttendanceLog, AttendanceSummary
 
 
 def create_user(session: Session, idx: int = 1) -> User:
@@ -60,12 +72,15 @@ def create_student(session: Session, user: User, dept: Department, idx: int = 1)
     return student
 
 
-def create_attendance(session: Session, student: Student, course: Course, present: bool = True) -> AttendanceLog:
+def create_attendance(
+    session: Session, student: Student, course: Course, present: bool = True, session_date: date | None = None
+) -> AttendanceLog:
     log = AttendanceLog(
         submitted_by="tester",
         student_id=student.id,
         course_id=course.id,
         present=present,
+        session_date=session_date or date.today(),
     )
     session.add(log)
     session.commit()
@@ -178,3 +193,225 @@ def test_attendance_log_crud(session: Session):
     session.delete(fetched)
     session.commit()
     assert session.get(AttendanceLog, log.id) is None
+
+
+def test_rebuild_attendance_summary(session: Session):
+    user = create_user(session, 5)
+    dept = create_department(session, 5)
+    student = create_student(session, user, dept, 501)
+    course = create_course(session, dept, 501)
+    for day, present in enumerate((True, False, True)):
+        create_attendance(session, student, course, present=present, session_date=date(2025, 9, 1 + day))
+
+    rebuild_attendance_summary(session)
+    session.commit()
+
+    summary = session.get(AttendanceSummary, (student.id, course.id))
+    assert (summary.present_count, summary.total_count) == (2, 3)
+
+
+def test_upgrade_keeps_newest_duplicate_mark(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    SQLModel.metadata.create_all(engine)
+    # A database from before marks were unique per session day
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ux_attendancelog_student_course_session")
+
+    with Session(engine) as session:
+        student = create_student(session, create_user(session), create_department(session))
+        course = create_course(session, session.get(Department, student.department_id))
+        student_id, course_id = student.id, course.id
+        for present, hour in ((True, 9), (False, 10), (True, 8)):
+            session.add(AttendanceLog(
+                submitted_by="tester", student_id=student_id, course_id=course_id, present=present,
+                session_date=date(2025, 9, 1), updated_at=datetime(2025, 9, 1, hour),
+            ))
+        session.commit()
+        rebuild_attendance_summary(session)
+        session.commit()
+
+    db.upgrade_schema(engine)
+
+    with Session(engine) as session:
+        logs = session.exec(select(AttendanceLog)).all()
+        # The 10:00 mark, second of the three
+        assert [(log.id, log.present) for log in logs] == [(2, False)]
+        summary = session.get(AttendanceSummary, (student_id, course_id))
+        assert (summary.present_count, summary.total_count) == (0, 1)
+        # Writes can upsert on the natural key again
+        upsert_attendance_logs(session, [attendance_row("tester", student_id, course_id, True, date(2025, 9, 1))])
+        session.commit()
+        assert session.exec(select(AttendanceLog.present)).all() == [True]
+    engine.dispose()
+
+
+def test_reference_index_sees_other_writers(tmp_path):
+    url = f"sqlite:///{tmp_path / 'shared.db'}"
+    engine, other_engine = create_db_engine(url), create_db_engine(url)
+    SQLModel.metadata.create_all(engine)
+    index = ReferenceIndex(refresh_seconds=60)
+
+    with Session(engine) as session:
+        assert not index.contains(session, Department, 1)
+        # Committed by another process after this one loaded its index
+        with Session(other_engine) as other:
+            dept_id = create_department(other).id
+        assert not index.known(session, Department, dept_id)
+        assert index.contains(session, Department, dept_id)
+        assert index.known(session, Department, dept_id)
+    engine.dispose()
+    other_engine.dispose()
+
+
+def test_upsert_is_one_statement(session: Session):
+    dept = create_department(session)
+    course = create_course(session, dept)
+    user = create_user(session)
+    student_ids = [create_student(session, user, dept, idx).id for idx in range(1, 4)]
+    rows = [attendance_row("tester", student_id, course.id, True, date(2025, 9, 1)) for student_id in student_ids]
+    first_ids = upsert_attendance_logs(session, rows)
+
+    inserts = []
+    listener = lambda conn, cursor, statement, *args: inserts.append(statement)
+    event.listen(session.get_bind(), "before_cursor_execute", listener)
+    try:
+        # Re-marked in a different order: ids still follow the input rows
+        ids = upsert_attendance_logs(session, rows[::-1])
+    finally:
+        event.remove(session.get_bind(), "before_cursor_execute", listener)
+    assert ids == first_ids[::-1]
+    assert len([statement for statement in inserts if statement.startswith("INSERT INTO attendancelog")]) == 1
+
+
+def test_sqlite_engine_pragmas(tmp_path):
+    config = Settings(sqlite_busy_timeout_ms=1234, db_pool_size=2, db_max_overflow=0)
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'pragmas.db'}", config)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 1234
+        assert conn.exec_driver_sql("PRAGMA foreign_keys").scalar() == 1
+    assert engine.pool.size() == 2
+    engine.dispose()
+
+
+def test_archive_partition_pruning(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'attendance_2025.db'}")
+    for term in ("2025-spring", "2025-summer"):
+        archive_table(term).metadata.create_all(engine)
+    engine.dispose()
+
+    registry = ArchiveRegistry(tmp_path)
+    registry.refresh(force=True)
+    assert list(registry.terms) == ["2025-spring", "2025-summer"]
+    assert registry.partitions(date(2025, 2, 1), date(2025, 3, 1)) == (False, ("2025-spring",))
+    assert registry.partitions(date(2025, 2, 1), date(2025, 8, 1)) == (False, ("2025-spring", "2025-summer"))
+    assert registry.partitions(date(2025, 5, 1), date(2025, 9, 1)) == (True, ("2025-spring", "2025-summer"))
+    assert registry.partitions(date(2025, 9, 1), None) == (True, ())
+    assert registry.partitions(None, None) == (True, ("2025-spring", "2025-summer"))
+    assert registry.archived_term(date(2025, 6, 30)) == "2025-summer"
+    assert registry.archived_term(date(2025, 8, 1)) is None
+
+
+def search_names(session: Session, q: str) -> list[str]:
+    rows = session.execute(SEARCH_QUERY, {"match": match_expression(q), "kind": None, "limit": 10})
+    return [row.name for row in rows]
+
+
+def test_search_index_follows_writes(session: Session):
+    user = create_user(session)
+    dept = create_department(session)
+    course = create_course(session, dept)
+    assert search_names(session, "test us") == ["Test User 1"]
+    assert search_names(session, "cour") == ["Course 1"]
+
+    user.full_name = "Ada Lovelace"
+    session.add(user)
+    session.delete(course)
+    session.commit()
+    assert search_names(session, "lovel") == ["Ada Lovelace"]
+    assert search_names(session, "test") == []
+    assert search_names(session, "course") == []
+
+    session.execute(text("DELETE FROM search_index"))
+    rebuild_search_index(session)
+    session.commit()
+    assert search_names(session, "user1") == ["Ada Lovelace"]
+
+
+def test_roll_call_query_is_covered(session: Session):
+    plan = session.execute(text(
+        "EXPLAIN QUERY PLAN SELECT student_id, present FROM attendancelog WHERE course_id = 1"
+    )).all()
+    assert [row[3] for row in plan] == [
+        "SEARCH attendancelog USING COVERING INDEX ix_attendancelog_course_student_present (course_id=?)"
+    ]
+
+
+def test_full_scan_detection():
+    sizes = {"student": 5000, "attendancelog": 5000, "department": 10}
+    joined = "SELECT student_1.id FROM attendancelog JOIN student AS student_1 ON student_1.id = attendancelog.student_id"
+    assert full_scans(joined, ["SCAN student_1", "SEARCH attendancelog USING INDEX ix (student_id=?)"], sizes, 1000) == ["student"]
+    assert full_scans("SELECT id FROM department", ["SCAN department"], sizes, 1000) == []
+    paged = "SELECT id FROM attendancelog ORDER BY updated_at, id LIMIT ?"
+    assert full_scans(paged, ["SCAN attendancelog USING INDEX ix_attendancelog_updated_at_id"], sizes, 1000) == []
+    unpaged = "SELECT id FROM attendancelog ORDER BY updated_at, id"
+    assert full_scans(unpaged, ["SCAN attendancelog USING INDEX ix_attendancelog_updated_at_id"], sizes, 1000) == ["attendancelog"]
+    by_id = "SELECT id FROM attendancelog ORDER BY id LIMIT ?"
+    assert full_scans(by_id, ["SCAN attendancelog"], sizes, 1000) == []
+    sorted_page = "SELECT id FROM attendancelog ORDER BY present LIMIT ?"
+    assert full_scans(sorted_page, ["SCAN attendancelog", "USE TEMP B-TREE FOR ORDER BY"], sizes, 1000) == ["attendancelog"]
+
+
+def test_shared_generations_across_caches(tmp_path):
+    # Two caches over one generation file stand in for two worker processes
+    path = str(tmp_path / "generations")
+    SharedGenerations.create(path, 64).close()
+    first, second = ResponseCache(16, 60), ResponseCache(16, 60)
+    first.use_shared(SharedGenerations(path))
+    second.use_shared(SharedGenerations(path))
+    assert first.etag("students") == second.etag("students")
+
+    generation = first.generation("students")
+    first.set("students", b"[]", generation)
+    assert first.get("students") == b"[]"
+
+    second.invalidate("students")
+    assert first.generation("students") == generation + 1
+    assert first.get("students") is None
+    # A body loaded before the invalidation is not stored
+    first.set("students", b"[]", generation)
+    assert first.get("students") is None
+    assert first.etag("students") == second.etag("students")
+
+    for cache in (first, second):
+        shared = cache.shared
+        cache.use_shared(None)
+        shared.close()
+
+
+def test_schema_version_skips_setup(tmp_path, monkeypatch):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    setups = []
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "create_db_and_tables", lambda: setups.append(SQLModel.metadata.create_all(engine)))
+
+    assert db.ensure_schema() is True
+    assert stored_schema_version(engine) == schema_fingerprint(engine.dialect)
+    assert db.ensure_schema() is False
+    assert len(setups) == 1
+
+    # A database set up by an older build of the models
+    with engine.begin() as conn:
+        conn.execute(schema_version.update().values(version="older"))
+    assert db.ensure_schema() is True
+    assert len(setups) == 2
+
+    # A setup that leaves an index out records no version, so it reruns
+    with engine.begin() as conn:
+        conn.execute(schema_version.delete())
+        conn.exec_driver_sql("DROP INDEX ix_attendancelog_course_id")
+    with pytest.raises(RuntimeError, match="ix_attendancelog_course_id"):
+        db.ensure_schema()
+    assert stored_schema_version(engine) is None
+    engine.dispose()
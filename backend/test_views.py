@@ -1,12 +1,34 @@
+import csv
+import io
+import asyncio
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
 from typing import Generator
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import SQLModel, Session, create_engine
+from pydantic import TypeAdapter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import SQLModel, Session, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from main import app
-from db import get_session
+from analytics import attendance_matrices
+from archive import archive_term, archives, attach_archives
+from cache import response_cache
+from config import settings
+from feed import AttendanceFeed
+from credentials import password_hasher
+from instrumentation import metrics
+from write_queue import attendance_write_queue
+from models import AttendanceLogRead, CourseRead, DepartmentRead, StudentRead, User, UserRead
+from db import get_session, get_async_session
 
 # Try to import router if endpoints exist; safe if empty
 try:
@@ -17,6 +39,7 @@ except Exception:
 
 
 TEST_DB_URL = "sqlite:///./assessment_api_test.db"
+TEST_ASYNC_DB_URL = "sqlite+aiosqlite:///./assessment_api_test.db"
 
 
 def _build_test_engine():
@@ -26,20 +49,47 @@ def _build_test_engine():
 	)
 
 
+@pytest.fixture(scope="session", autouse=True)
+def password_pool():
+	yield
+	password_hasher.shutdown()
+
+
 @pytest.fixture(scope="function")
-def client() -> Generator[TestClient, None, None]:
+def client(monkeypatch) -> Generator[TestClient, None, None]:
 	engine = _build_test_engine()
 
 	# Fresh tables for each test
 	SQLModel.metadata.drop_all(engine)
 	SQLModel.metadata.create_all(engine)
 
+	# Connections are not pooled across tests since each TestClient runs its own event loop
+	async_engine = create_async_engine(TEST_ASYNC_DB_URL, poolclass=NullPool)
+	attach_archives(engine)
+	attach_archives(async_engine.sync_engine)
+
 	def override_get_session() -> Generator[Session, None, None]:
 		with Session(engine) as session:
 			yield session
 
-	# Override the app's DB dependency
+	async def override_get_async_session():
+		async with AsyncSession(async_engine, expire_on_commit=False) as session:
+			yield session
+
+	response_cache.clear()
+	archives.refresh(force=True)
+
+	# Override the app's DB dependencies
 	app.dependency_overrides[get_session] = override_get_session
+	app.dependency_overrides[get_async_session] = override_get_async_session
+	# The lifespan would otherwise set up and connect to the real database
+	monkeypatch.setattr(settings, "schema_setup", False)
+	monkeypatch.setattr(settings, "db_pool_prewarm", 0)
+	# Hashing at the production cost would dominate the suite's run time, as
+	# would restarting the hashing pool whenever a client's lifespan ends
+	monkeypatch.setattr(password_hasher, "n", 2**4)
+	monkeypatch.setattr(password_hasher, "workers", 1)
+	monkeypatch.setattr(password_hasher, "shutdown", password_hasher._verified.clear)
 
 	with TestClient(app) as c:
 		yield c
@@ -294,3 +344,855 @@ def test_attendance_logs_crud_contract(client: TestClient):
 
 	delete_resp = client.delete(f"/attendance-logs/{log_id}")
 	assert delete_resp.status_code == 204
+
+
+def _seed_attendance(client: TestClient, count: int) -> dict:
+	dept_id = client.post("/departments", json={"submitted_by": "tester", "department_name": "CS"}).json()["id"]
+	course_ids = [
+		client.post(
+			"/course",
+			json={
+				"submitted_by": "tester",
+				"course_name": f"Course {i}",
+				"department_id": dept_id,
+				"semester": "Fall",
+				"class_id": 1,
+				"lecture_hours": 3,
+			},
+		).json()["id"]
+		for i in range(2)
+	]
+	client.post(
+		"/users",
+		json={
+			"submitted_by": "tester",
+			"user_type": "student",
+			"full_name": "Grace Doe",
+			"username": "grace",
+			"email": "grace@example.com",
+			"password": "secret",
+		},
+	)
+	student_id = client.post(
+		"/student",
+		json={"submitted_by": "tester", "user_id": 1, "department_id": dept_id, "class_id": 1},
+	).json()["id"]
+	for i in range(count):
+		client.post(
+			"/attendance-log",
+			json={
+				"submitted_by": "tester",
+				"student_id": student_id,
+				"course_id": course_ids[i % 2],
+				"present": i % 3 != 0,
+				"session_date": str(date(2025, 9, 1) + timedelta(days=i)),
+			},
+		)
+	return {"department_id": dept_id, "course_ids": course_ids, "student_id": student_id}
+
+
+def test_attendance_log_keyset_pagination(client: TestClient):
+	_seed_attendance(client, 7)
+
+	seen = []
+	cursor = None
+	while True:
+		params = {"limit": 3}
+		if cursor:
+			params["cursor"] = cursor
+		resp = client.get("/attendance-log", params=params)
+		assert resp.status_code == 200
+		page = resp.json()
+		assert len(page) <= 3
+		seen.extend(log["id"] for log in page)
+		cursor = resp.headers.get("X-Next-Cursor")
+		if cursor is None:
+			break
+
+	assert seen == list(range(1, 8))
+
+
+def test_attendance_log_pagination_survives_remarks(client: TestClient):
+	seed = _seed_attendance(client, 4)
+
+	first = client.get("/attendance-log", params={"limit": 2})
+	assert [log["id"] for log in first.json()] == [1, 2]
+	# Re-marking a row already paged past rewrites its updated_at
+	client.post(
+		"/attendance-log",
+		json={
+			"submitted_by": "tester",
+			"student_id": seed["student_id"],
+			"course_id": seed["course_ids"][0],
+			"present": True,
+			"session_date": "2025-09-01",
+		},
+	)
+	seen = [log["id"] for log in first.json()]
+	cursor = first.headers.get("X-Next-Cursor")
+	while cursor:
+		resp = client.get("/attendance-log", params={"limit": 2, "cursor": cursor})
+		seen.extend(log["id"] for log in resp.json())
+		cursor = resp.headers.get("X-Next-Cursor")
+	assert seen == [1, 2, 3, 4]
+
+
+def test_attendance_log_filters(client: TestClient):
+	seed = _seed_attendance(client, 6)
+	course_id = seed["course_ids"][0]
+
+	resp = client.get("/attendance-log", params={"course_id": course_id, "present": True})
+	assert resp.status_code == 200
+	logs = resp.json()
+	assert [log["id"] for log in logs] == [3, 5]
+	assert all(log["course"]["id"] == course_id and log["present"] for log in logs)
+
+	resp = client.get("/attendance-log", params={"date_from": "2999-01-01T00:00:00"})
+	assert resp.json() == []
+
+	resp = client.get("/attendance-log", params={"cursor": "not-a-cursor"})
+	assert resp.status_code == 400
+
+
+@contextmanager
+def _count_queries():
+	statements = []
+
+	def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+		statements.append(statement)
+
+	event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+	try:
+		yield statements
+	finally:
+		event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.mark.parametrize("path", ["/attendance-log", "/students", "/courses"])
+def test_list_endpoints_issue_constant_queries(client: TestClient, path: str):
+	_seed_attendance(client, 2)
+	with _count_queries() as small:
+		assert client.get(path).status_code == 200
+
+	_seed_attendance_more(client, 10)
+	with _count_queries() as large:
+		resp = client.get(path)
+	assert resp.status_code == 200
+	assert len(resp.json()) > 2
+	assert len(large) == len(small) == 1
+
+
+def _seed_attendance_more(client: TestClient, count: int) -> None:
+	for i in range(count):
+		dept_id = client.post("/departments", json={"submitted_by": "tester", "department_name": f"D{i}"}).json()["id"]
+		course_id = client.post(
+			"/course",
+			json={
+				"submitted_by": "tester",
+				"course_name": f"Extra {i}",
+				"department_id": dept_id,
+				"semester": "Fall",
+				"class_id": 2,
+				"lecture_hours": 3,
+			},
+		).json()["id"]
+		user_id = client.post(
+			"/users",
+			json={
+				"submitted_by": "tester",
+				"user_type": "student",
+				"full_name": f"Extra {i}",
+				"username": f"extra{i}",
+				"email": f"extra{i}@example.com",
+				"password": "secret",
+			},
+		).json()["id"]
+		student_id = client.post(
+			"/student",
+			json={"submitted_by": "tester", "user_id": user_id, "department_id": dept_id, "class_id": 2},
+		).json()["id"]
+		client.post(
+			"/attendance-log",
+			json={"submitted_by": "tester", "student_id": student_id, "course_id": course_id, "present": True},
+		)
+
+
+def test_analytics(client: TestClient, monkeypatch):
+	monkeypatch.setattr(attendance_matrices, "refresh_seconds", 0)
+	seed = _seed_attendance(client, 5)  # course 0: 2 of 3 present, course 1: 1 of 2
+	_seed_attendance_more(client, 1)  # marked today, so in the current term
+	student_id = seed["student_id"]
+	first, second = seed["course_ids"]
+
+	def below(threshold):
+		resp = client.get("/analytics/below-threshold", params={"term": "2025-fall", "threshold": threshold})
+		assert resp.status_code == 200
+		return [(row["course_id"], row["present_count"], row["total_count"]) for row in resp.json()]
+
+	assert below(0.75) == [(second, 1, 2), (first, 2, 3)]
+	assert below(0.6) == [(second, 1, 2)]
+
+	def mark(course_id, day, present):
+		client.post(
+			"/attendance-log",
+			json={
+				"submitted_by": "tester",
+				"student_id": student_id,
+				"course_id": course_id,
+				"present": present,
+				"session_date": day,
+			},
+		)
+
+	# A re-marked session changes present only; a new one adds to total
+	mark(second, "2025-09-04", True)
+	mark(first, "2025-09-20", False)
+	assert below(0.75) == [(first, 2, 4)]
+
+	ranking = client.get(
+		"/analytics/ranking", params={"term": "2025-fall", "by": "course", "order": "desc"}
+	).json()
+	assert [(row["id"], row["attendance_rate"]) for row in ranking] == [(second, 1.0), (first, 0.5)]
+	[row] = client.get("/analytics/ranking", params={"term": "2025-fall"}).json()
+	assert (row["id"], row["present_count"], row["total_count"]) == (student_id, 4, 6)
+
+	[department] = client.get("/analytics/departments", params={"term": "2025-fall"}).json()
+	assert department == {
+		"department_id": seed["department_id"],
+		"courses": 2,
+		"students": 1,
+		"students_below_threshold": 1,
+		"present_count": 4,
+		"total_count": 6,
+		"attendance_rate": 4 / 6,
+	}
+
+	# Without a term the current one is used
+	[row] = client.get("/analytics/ranking").json()
+	assert row["id"] != student_id and row["attendance_rate"] == 1.0
+	assert client.get("/analytics/ranking", params={"term": "2025-autumn"}).status_code == 422
+
+
+def test_login(client: TestClient):
+	created = client.post(
+		"/users",
+		json={
+			"submitted_by": "tester",
+			"user_type": "staff",
+			"full_name": "Ada Doe",
+			"username": "ada",
+			"email": "ada@example.com",
+			"password": "correct horse",
+		},
+	).json()
+	assert "password" not in created
+
+	engine = _build_test_engine()
+	with Session(engine) as session:
+		stored = session.get(User, created["id"]).password
+		assert stored.startswith("scrypt$") and "correct horse" not in stored
+		# A row from before passwords were hashed
+		session.add(User(
+			submitted_by="tester", user_type="staff", full_name="Old Doe",
+			username="old", email="old@example.com", password="plain",
+		))
+		session.commit()
+
+	resp = client.post("/login", json={"username": "ada", "password": "correct horse"})
+	assert resp.status_code == 200
+	assert resp.json() == created
+	assert len(password_hasher._verified) == 1
+	assert client.post("/login", json={"username": "ada", "password": "correct horse"}).status_code == 200
+	assert len(password_hasher._verified) == 1
+	assert client.post("/login", json={"username": "ada", "password": "wrong"}).status_code == 401
+	assert client.post("/login", json={"username": "nobody", "password": "wrong"}).status_code == 401
+
+	assert client.post("/login", json={"username": "old", "password": "plain"}).status_code == 200
+	with Session(engine) as session:
+		upgraded = session.exec(select(User).where(User.username == "old")).one().password
+	assert upgraded.startswith("scrypt$")
+	assert client.post("/login", json={"username": "old", "password": "plain"}).status_code == 200
+	assert client.post("/login", json={"username": "old", "password": upgraded}).status_code == 401
+
+
+def test_import(client: TestClient, monkeypatch):
+	monkeypatch.setattr(settings, "import_chunk_size", 2)
+	dept_id = client.post("/departments", json={"submitted_by": "tester", "department_name": "CS"}).json()["id"]
+	users_csv = "\n".join([
+		"submitted_by,user_type,full_name,username,email,password",
+		"importer,student,Ada Doe,ada,ada@example.com,pw1",
+		"importer,student,Bob Doe,bob,bob@example.com,pw2",
+		"importer,student,Ada Again,ada,ada2@example.com,pw3",  # username taken by the first chunk
+		"importer,student,No Email,noemail,,pw4",
+		"importer,student,Cy Doe,cy,cy@example.com,pw5",
+	])
+	resp = client.post("/import/users", content=users_csv, headers={"content-type": "text/csv"})
+	assert resp.status_code == 200
+	records = [json.loads(line) for line in resp.text.splitlines()]
+	errors = [record for record in records if "row" in record]
+	assert [(error["row"], error["errors"][0]["loc"]) for error in errors] == [(3, ["username"])]
+	assert records[-1] == {"processed": 5, "inserted": 4, "rejected": 1, "done": True}
+	# Chunks commit as they go, with a progress line after each
+	assert [record["processed"] for record in records if "inserted" in record] == [2, 4, 5, 5]
+
+	users = client.get("/users").json()
+	assert [user["full_name"] for user in users] == ["Ada Doe", "Bob Doe", "No Email", "Cy Doe"]
+	assert client.post("/login", json={"username": "cy", "password": "pw5"}).status_code == 200
+
+	students = "\n".join(json.dumps(row) for row in [
+		{"submitted_by": "importer", "user_id": users[0]["id"], "department_id": dept_id, "class_id": 1},
+		{"submitted_by": "importer", "user_id": 999, "department_id": dept_id, "class_id": 1},
+		{"submitted_by": "importer", "user_id": users[1]["id"], "department_id": dept_id},
+		"not json",
+	]) + "\n{not json"
+	records = [json.loads(line) for line in client.post("/import/students?format=ndjson", content=students).text.splitlines()]
+	errors = {record["row"]: record["errors"][0] for record in records if "row" in record}
+	assert errors[2]["msg"] == "User 999 does not exist"
+	assert errors[3]["loc"] == ["class_id"]
+	assert errors[5]["type"] == "json_invalid"
+	assert records[-1] == {"processed": 5, "inserted": 1, "rejected": 4, "done": True}
+	assert [student["user"]["full_name"] for student in client.get("/students").json()] == ["Ada Doe"]
+
+
+def test_attendance_feed(client: TestClient):
+	seed = _seed_attendance(client, 0)
+	first, second = seed["course_ids"]
+
+	def mark(course_id, day):
+		client.post(
+			"/attendance-log",
+			json={
+				"submitted_by": "tester",
+				"student_id": seed["student_id"],
+				"course_id": course_id,
+				"present": True,
+				"session_date": day,
+			},
+		)
+
+	with client.websocket_connect(f"/attendance-log/feed/ws?course_id={first}") as ws:
+		mark(second, "2025-09-01")
+		mark(first, "2025-09-02")
+		event = ws.receive_json()
+		assert event["event"] == "attendance"
+		assert event["data"]["course_id"] == first and event["data"]["class_id"] == 1
+		assert event["data"]["session_date"] == "2025-09-02"
+
+		client.post(
+			"/attendance-log/bulk",
+			json={
+				"submitted_by": "tester",
+				"course_id": first,
+				"class_id": 1,
+				"session_date": "2025-09-03",
+				"entries": [{"student_id": seed["student_id"], "present": False}],
+			},
+		)
+		bulk = ws.receive_json()
+		assert (bulk["data"]["session_date"], bulk["data"]["present"]) == ("2025-09-03", False)
+
+	# Resuming after the first event replays what was missed, for the class
+	mark(second, "2025-09-04")
+	with client.websocket_connect(f"/attendance-log/feed/ws?class_id=1&last_event_id={event['id']}") as ws:
+		assert [ws.receive_json()["data"]["session_date"] for _ in range(2)] == ["2025-09-03", "2025-09-04"]
+	with client.websocket_connect("/attendance-log/feed/ws?last_event_id=gone-1") as ws:
+		assert ws.receive_json()["event"] == "reset"
+
+
+def test_attendance_feed_backpressure():
+	async def run():
+		feed = AttendanceFeed(history_size=8, queue_size=2)
+		slow, _ = feed.subscribe(frozenset({"course:1"}))
+		other, _ = feed.subscribe(frozenset({"course:2"}))
+		for i in range(6):
+			feed.publish({"i": i}, ("course:1",))
+		feed.publish({"i": "other"}, ("course:2",))
+		await asyncio.sleep(0)
+		# The slow subscriber's queue overflowed; it catches up from history
+		assert slow.lagging
+		assert [(await slow.next(0.1))["data"]["i"] for _ in range(6)] == list(range(6))
+		assert await slow.next(0.01) is None
+		assert (await other.next(0.1))["data"]["i"] == "other"
+
+		for i in range(12):
+			feed.publish({"i": i}, ("course:1",))
+		await asyncio.sleep(0)
+		# More was missed than history holds
+		assert [(await slow.next(0.1))["event"] for _ in range(3)] == ["attendance", "attendance", "reset"]
+
+	asyncio.run(run())
+
+
+def test_attendance_log_bulk_roll_call(client: TestClient):
+	seed = _seed_attendance(client, 0)
+	course_id = seed["course_ids"][0]
+	student_id = seed["student_id"]
+	_seed_attendance_more(client, 1)  # student 2 lives in class 2
+
+	resp = client.post(
+		"/attendance-log/bulk",
+		json={
+			"submitted_by": "tester",
+			"course_id": course_id,
+			"class_id": 1,
+			"entries": [
+				{"student_id": student_id, "present": True},
+				{"student_id": student_id, "present": False},
+				{"student_id": 2, "present": True},
+				{"student_id": 999, "present": True},
+			],
+		},
+	)
+	assert resp.status_code == 200
+	results = resp.json()
+	assert [r["status"] for r in results] == ["created", "rejected", "rejected", "rejected"]
+	assert [r["detail"] for r in results] == [None, "Duplicate entry", "Student not in class", "Student not found"]
+
+	logs = client.get("/attendance-log", params={"course_id": course_id}).json()
+	assert [log["id"] for log in logs] == [results[0]["id"]]
+	assert logs[0]["present"] is True
+
+
+def test_attendance_log_bulk_unknown_course(client: TestClient):
+	seed = _seed_attendance(client, 0)
+	resp = client.post(
+		"/attendance-log/bulk",
+		json={
+			"submitted_by": "tester",
+			"course_id": seed["course_ids"][0],
+			"class_id": 42,
+			"entries": [{"student_id": seed["student_id"], "present": True}],
+		},
+	)
+	assert resp.status_code == 404
+
+
+def test_attendance_log_post_upserts_on_natural_key(client: TestClient):
+	seed = _seed_attendance(client, 0)
+	payload = {
+		"submitted_by": "tester",
+		"student_id": seed["student_id"],
+		"course_id": seed["course_ids"][0],
+		"present": True,
+		"session_date": "2025-09-01",
+	}
+	first = client.post("/attendance-log", json=payload)
+	again = client.post("/attendance-log", json=payload)
+	assert first.status_code == again.status_code == 200
+	assert again.json()["id"] == first.json()["id"]
+
+	flipped = client.post("/attendance-log", json={**payload, "present": False})
+	assert flipped.json()["id"] == first.json()["id"]
+	assert flipped.json()["present"] is False
+
+	assert len(client.get("/attendance-log").json()) == 1
+	summary = client.get(f"/students/{seed['student_id']}/attendance-summary").json()
+	assert [(row["present_count"], row["total_count"]) for row in summary] == [(0, 1)]
+
+
+def test_attendance_log_idempotency_key(client: TestClient):
+	seed = _seed_attendance(client, 0)
+	payload = {
+		"submitted_by": "tester",
+		"student_id": seed["student_id"],
+		"course_id": seed["course_ids"][0],
+		"present": True,
+		"session_date": "2025-09-01",
+	}
+	headers = {"Idempotency-Key": "retry-1"}
+	first = client.post("/attendance-log", json=payload, headers=headers)
+	retry = client.post("/attendance-log", json=payload, headers=headers)
+	assert retry.json()["id"] == first.json()["id"]
+
+	reused = client.post("/attendance-log", json={**payload, "session_date": "2025-09-02"}, headers=headers)
+	assert reused.status_code == 409
+	assert len(client.get("/attendance-log").json()) == 1
+
+
+def test_attendance_log_bulk_repeat_updates(client: TestClient):
+	seed = _seed_attendance(client, 0)
+	body = {
+		"submitted_by": "tester",
+		"course_id": seed["course_ids"][0],
+		"class_id": 1,
+		"session_date": "2025-09-01",
+		"entries": [{"student_id": seed["student_id"], "present": True}],
+	}
+	first = client.post("/attendance-log/bulk", json=body).json()
+	body["entries"][0]["present"] = False
+	second = client.post("/attendance-log/bulk", json=body).json()
+	assert [r["status"] for r in first] == ["created"]
+	assert [r["status"] for r in second] == ["updated"]
+	assert second[0]["id"] == first[0]["id"]
+
+	summary = client.get(f"/students/{seed['student_id']}/attendance-summary").json()
+	assert [(row["present_count"], row["total_count"]) for row in summary] == [(0, 1)]
+
+
+def test_attendance_log_write_behind(client: TestClient, monkeypatch):
+	seed = _seed_attendance(client, 0)
+	engine = _build_test_engine()
+	monkeypatch.setattr(attendance_write_queue, "window_ms", 50)
+	batches = attendance_write_queue.batches
+
+	def mark(day: int, key: str):
+		return client.post(
+			"/attendance-log",
+			json={
+				"submitted_by": "tester",
+				"student_id": seed["student_id"],
+				"course_id": seed["course_ids"][0],
+				"present": day % 2 == 0,
+				"session_date": str(date(2025, 9, 1) + timedelta(days=day)),
+			},
+			headers={"Idempotency-Key": key},
+		)
+
+	client.portal.call(attendance_write_queue.start, lambda: Session(engine))
+	try:
+		with ThreadPoolExecutor(max_workers=10) as pool:
+			responses = list(pool.map(mark, range(20), [f"key-{day}" for day in range(20)]))
+			# A reused key fails its own request without failing the batch
+			conflicting = list(pool.map(mark, [30, 31], ["reused", "reused"]))
+	finally:
+		client.portal.call(attendance_write_queue.stop)
+	assert not attendance_write_queue.running
+
+	assert [resp.status_code for resp in responses] == [200] * 20
+	assert len({resp.json()["id"] for resp in responses}) == 20
+	assert attendance_write_queue.batches - batches < 20
+	assert sorted(resp.status_code for resp in conflicting) == [200, 409]
+	assert len(client.get("/attendance-log", params={"limit": 100}).json()) == 21
+	summary = client.get(f"/students/{seed['student_id']}/attendance-summary").json()
+	assert [row["total_count"] for row in summary] == [21]
+
+
+def test_attendance_log_archived_terms(client: TestClient, tmp_path, monkeypatch):
+	seed = _seed_attendance(client, 3)  # session dates in 2025-fall
+	spring = client.post(
+		"/attendance-log",
+		json={
+			"submitted_by": "tester",
+			"student_id": seed["student_id"],
+			"course_id": seed["course_ids"][0],
+			"present": True,
+			"session_date": "2025-02-03",
+		},
+	).json()
+	monkeypatch.setattr(archives, "directory", tmp_path)
+
+	assert archive_term("assessment_api_test.db", "2025-spring", tmp_path) == 1
+	archives.refresh(force=True)
+	assert list(archives.terms) == ["2025-spring"]
+
+	assert [log["id"] for log in client.get("/attendance-log").json()] == [1, 2, 3, spring["id"]]
+	assert [log["id"] for log in client.get("/attendance-log", params={"term": "2025-spring"}).json()] == [spring["id"]]
+	assert len(client.get("/attendance-log", params={"term": "2025-fall"}).json()) == 3
+	resp = client.get("/attendance-log", params={"session_date_from": "2025-01-01", "limit": 2})
+	assert [log["id"] for log in resp.json()] == [1, 2]
+	resp = client.get("/attendance-log", params={"session_date_from": "2025-01-01", "cursor": resp.headers["X-Next-Cursor"]})
+	assert [log["id"] for log in resp.json()] == [3, spring["id"]]
+
+	rows = list(csv.DictReader(io.StringIO(
+		client.get("/attendance-log/export", params={"format": "csv", "term": "2025-spring"}).text
+	)))
+	assert [row["id"] for row in rows] == [str(spring["id"])]
+
+	resp = client.post(
+		"/attendance-log",
+		json={
+			"submitted_by": "tester",
+			"student_id": seed["student_id"],
+			"course_id": seed["course_ids"][0],
+			"present": False,
+			"session_date": "2025-02-03",
+		},
+	)
+	assert resp.status_code == 409
+	assert client.get("/attendance-log", params={"term": "2025-winter"}).status_code == 422
+
+
+def test_create_endpoints_reject_unknown_references(client: TestClient):
+	seed = _seed_attendance(client, 0)
+
+	resp = client.post(
+		"/course",
+		json={
+			"submitted_by": "tester",
+			"course_name": "Orphan",
+			"department_id": 999,
+			"semester": "Fall",
+			"class_id": 1,
+			"lecture_hours": 3,
+		},
+	)
+	assert resp.status_code == 422
+	assert resp.json()["detail"][0]["loc"] == ["body", "department_id"]
+
+	resp = client.post(
+		"/student",
+		json={"submitted_by": "tester", "user_id": 999, "department_id": 998, "class_id": 1},
+	)
+	assert resp.status_code == 422
+	assert [error["loc"][-1] for error in resp.json()["detail"]] == ["user_id", "department_id"]
+
+	payload = {
+		"submitted_by": "tester",
+		"student_id": seed["student_id"],
+		"course_id": seed["course_ids"][0],
+		"present": True,
+		"session_date": "2025-09-01",
+	}
+	assert client.post("/attendance-log", json=payload).status_code == 200
+	# The first write loaded the index, so a bad id costs one key lookup
+	# (it may have been written by another process) and no transaction
+	with _count_queries() as statements:
+		resp = client.post("/attendance-log", json={**payload, "course_id": 999})
+	assert resp.status_code == 422
+	assert resp.json()["detail"][0]["msg"] == "Course 999 does not exist"
+	assert [" ".join(statement.split()) for statement in statements] == [
+		"SELECT course.id FROM course WHERE course.id = ?"
+	]
+	assert len(client.get("/attendance-log").json()) == 1
+
+
+def test_search_users_and_courses(client: TestClient):
+	seed = _seed_attendance(client, 0)
+	_seed_attendance_more(client, 2)
+
+	resp = client.get("/search", params={"q": "gra"})
+	assert resp.status_code == 200
+	[hit] = resp.json()
+	assert (hit["kind"], hit["id"], hit["student_id"], hit["username"]) == ("user", 1, seed["student_id"], "grace")
+	assert hit["score"] > 0
+
+	courses = client.get("/search", params={"q": "course", "kind": "course"}).json()
+	assert sorted(hit["name"] for hit in courses) == ["Course 0", "Course 1"]
+	assert {hit["id"] for hit in courses} == set(seed["course_ids"])
+
+	# Matching all words, across name, username and email
+	hits = client.get("/search", params={"q": "extra 1"}).json()
+	assert sorted((hit["kind"], hit["name"]) for hit in hits) == [("course", "Extra 1"), ("user", "Extra 1")]
+	assert [hit["name"] for hit in client.get("/search", params={"q": "extra1@example"}).json()] == ["Extra 1"]
+	assert len(client.get("/search", params={"q": "extra", "limit": 1}).json()) == 1
+	# FTS5 syntax in the query is treated as text
+	assert client.get("/search", params={"q": 'grace" OR NEAR(*'}).status_code == 200
+	assert client.get("/search", params={"q": "--"}).json() == []
+
+
+def test_class_roster(client: TestClient):
+	seed = _seed_attendance(client, 4)  # course 0 is marked on 09-01 (absent) and 09-03 (present)
+	_seed_attendance_more(client, 1)  # a student in class 2
+	course_id = seed["course_ids"][0]
+
+	with _count_queries() as statements:
+		resp = client.get("/classes/1/roster", params={"course_id": course_id})
+	assert resp.status_code == 200
+	assert len(statements) == 1
+	[entry] = resp.json()
+	assert entry["student_id"] == seed["student_id"]
+	assert entry["user"]["full_name"] == "Grace Doe"
+	assert entry["latest_attendance"]["session_date"] == "2025-09-03"
+	assert entry["latest_attendance"]["present"] is True
+
+	with _count_queries() as statements:
+		assert client.get("/classes/1/roster", params={"course_id": course_id}).json() == [entry]
+	assert statements == []
+
+	# Attendance and student writes retire the cached roster
+	client.post(
+		"/attendance-log",
+		json={
+			"submitted_by": "tester",
+			"student_id": seed["student_id"],
+			"course_id": course_id,
+			"present": False,
+			"session_date": "2025-09-10",
+		},
+	)
+	[entry] = client.get("/classes/1/roster", params={"course_id": course_id}).json()
+	assert entry["latest_attendance"]["session_date"] == "2025-09-10"
+
+	user_id = client.post(
+		"/users",
+		json={
+			"submitted_by": "tester",
+			"user_type": "student",
+			"full_name": "Alan Doe",
+			"username": "alan",
+			"email": "alan@example.com",
+			"password": "secret",
+		},
+	).json()["id"]
+	client.post(
+		"/student",
+		json={"submitted_by": "tester", "user_id": user_id, "department_id": seed["department_id"], "class_id": 1},
+	)
+	roster = client.get("/classes/1/roster", params={"course_id": course_id}).json()
+	assert [(row["user"]["full_name"], row["latest_attendance"]) for row in roster][0] == ("Alan Doe", None)
+	assert len(roster) == 2
+
+	assert client.get("/classes/2/roster", params={"course_id": course_id}).status_code == 404
+	assert client.get("/classes/1/roster").status_code == 422
+
+
+def test_attendance_log_export_ndjson(client: TestClient):
+	seed = _seed_attendance(client, 4)
+
+	resp = client.get("/attendance-log/export", params={"course_id": seed["course_ids"][1]})
+	assert resp.status_code == 200
+	assert resp.headers["content-type"].startswith("application/x-ndjson")
+	rows = [json.loads(line) for line in resp.text.splitlines()]
+	assert [row["id"] for row in rows] == [2, 4]
+	assert rows[0]["student_name"] == "Grace Doe"
+	assert rows[0]["course_name"] == "Course 1"
+	assert rows[0]["student_department"] == rows[0]["course_department"] == "CS"
+	assert "password" not in rows[0]
+
+
+def test_attendance_log_export_csv(client: TestClient):
+	_seed_attendance(client, 3)
+
+	resp = client.get("/attendance-log/export", params={"format": "csv"})
+	assert resp.status_code == 200
+	assert resp.headers["content-type"].startswith("text/csv")
+	rows = list(csv.DictReader(io.StringIO(resp.text)))
+	assert [row["id"] for row in rows] == ["1", "2", "3"]
+	assert rows[0]["username"] == "grace"
+
+	assert client.get("/attendance-log/export", params={"format": "xml"}).status_code == 422
+
+
+def test_attendance_summaries(client: TestClient):
+	seed = _seed_attendance(client, 6)  # present unless i % 3 == 0, courses alternate
+	student_id = seed["student_id"]
+	first, second = seed["course_ids"]
+	client.post(
+		"/attendance-log/bulk",
+		json={
+			"submitted_by": "tester",
+			"course_id": second,
+			"class_id": 1,
+			"entries": [{"student_id": student_id, "present": True}],
+		},
+	)
+
+	resp = client.get(f"/students/{student_id}/attendance-summary")
+	assert resp.status_code == 200
+	assert resp.json() == [
+		{"student_id": student_id, "course_id": first, "present_count": 2, "total_count": 3, "attendance_rate": 2 / 3},
+		{"student_id": student_id, "course_id": second, "present_count": 3, "total_count": 4, "attendance_rate": 0.75},
+	]
+
+	resp = client.get(f"/courses/{second}/attendance-summary")
+	assert [row["total_count"] for row in resp.json()] == [4]
+
+	assert client.get("/students/999/attendance-summary").status_code == 404
+	assert client.get("/courses/999/attendance-summary").status_code == 404
+
+
+def test_reference_lists_are_cached_until_written(client: TestClient):
+	client.post("/departments", json={"submitted_by": "tester", "department_name": "Physics"})
+
+	first = client.get("/departments")
+	with _count_queries() as statements:
+		second = client.get("/departments")
+	assert statements == []
+	assert second.content == first.content
+	assert [d["department_name"] for d in second.json()] == ["Physics"]
+
+	stats = client.get("/cache/stats").json()
+	assert (stats["hits"], stats["misses"]) == (1, 1)
+
+	client.post("/departments", json={"submitted_by": "tester", "department_name": "Chemistry"})
+	resp = client.get("/departments")
+	assert [d["department_name"] for d in resp.json()] == ["Physics", "Chemistry"]
+	assert client.get("/cache/stats").json()["misses"] == 2
+
+
+def test_cached_lists_match_response_models(client: TestClient):
+	_seed_attendance(client, 0)
+	for path in ("/courses", "/users"):
+		cold = client.get(path)
+		warm = client.get(path)
+		assert cold.status_code == warm.status_code == 200
+		assert cold.json() == warm.json()
+	assert client.get("/courses").json()[0]["department"]["department_name"] == "CS"
+	assert "password" not in client.get("/users").json()[0]
+
+
+@pytest.mark.parametrize("path", ["/students", "/courses", "/departments"])
+def test_list_endpoints_conditional_get(client: TestClient, path: str):
+	_seed_attendance(client, 0)
+
+	first = client.get(path)
+	etag = first.headers["ETag"]
+	with _count_queries() as statements:
+		resp = client.get(path, headers={"If-None-Match": etag})
+	assert resp.status_code == 304
+	assert resp.headers["ETag"] == etag
+	assert resp.content == b""
+	assert statements == []
+
+	assert client.get(path, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+	_seed_attendance_more(client, 1)
+	resp = client.get(path, headers={"If-None-Match": etag})
+	assert resp.status_code == 200
+	assert resp.headers["ETag"] != etag
+	assert len(resp.json()) == len(first.json()) + 1
+
+
+@pytest.mark.parametrize(
+	"path, read_model",
+	[
+		("/students", StudentRead),
+		("/courses", CourseRead),
+		("/departments", DepartmentRead),
+		("/users", UserRead),
+		("/attendance-log?limit=4", AttendanceLogRead),
+	],
+)
+def test_fast_serialization_matches_response_models(client: TestClient, monkeypatch, path: str, read_model):
+	_seed_attendance(client, 5)
+	_seed_attendance_more(client, 2)
+
+	monkeypatch.setattr(settings, "fast_serialization", False)
+	validated = client.get(path)
+	response_cache.clear()
+	monkeypatch.setattr(settings, "fast_serialization", True)
+	fast = client.get(path)
+
+	assert fast.status_code == validated.status_code == 200
+	assert fast.json() == validated.json()
+	assert fast.headers.get("X-Next-Cursor") == validated.headers.get("X-Next-Cursor")
+	TypeAdapter(list[read_model]).validate_python(fast.json())
+
+
+def test_server_timing_and_metrics(client: TestClient, monkeypatch):
+	monkeypatch.setattr(settings, "metrics_sample_rate", 1.0)
+	metrics.reset()
+	_seed_attendance(client, 3)
+
+	resp = client.get("/attendance-log")
+	assert resp.status_code == 200
+	timing = resp.headers["Server-Timing"]
+	assert 'desc="1 queries"' in timing
+	assert "serialize;dur=" in timing and "total;dur=" in timing
+
+	body = client.get("/metrics").text
+	assert 'http_requests_total{method="GET",route="/attendance-log",status="200"} 1' in body
+	assert 'db_queries_total{method="GET",route="/attendance-log"} 1' in body
+	assert 'http_request_duration_seconds_count{method="POST",route="/attendance-log"} 3' in body
+	assert "db_slowest_statement_seconds{rank=\"1\"" in body
+
+
+def test_unsampled_requests_skip_timing(client: TestClient, monkeypatch):
+	monkeypatch.setattr(settings, "metrics_sample_rate", 0.0)
+	metrics.reset()
+
+	resp = client.get("/departments")
+	assert "Server-Timing" not in resp.headers
+	body = client.get("/metrics").text
+	assert 'http_requests_total{method="GET",route="/departments",status="200"} 1' in body
+	assert 'db_queries_total{method="GET",route="/departments"}' not in body
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Callable, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from attendance import upsert_attendance_logs
+from config import settings
+
+
+class AttendanceWriteQueue:
+    # Write-behind for single attendance marks. Routes enqueue rows and await
+    # a future; one writer task collects whatever arrives within the batch
+    # window and commits it as a single transaction, so a burst pays for one
+    # SQLite write lock and one fsync per batch instead of one per request.
+    # A future resolves only after its batch has committed.
+
+    def __init__(self, window_ms: float, max_batch: int, max_pending: int):
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.session_factory: Optional[Callable[[], Session]] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.rows = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, session_factory: Callable[[], Session]):
+        self.session_factory = session_factory
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Lets everything already queued commit before the task exits
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, row: dict) -> int:
+        future = asyncio.get_running_loop().create_future()
+        # A full queue makes callers wait here, which is the backpressure
+        await self._queue.put((row, future))
+        return await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            await asyncio.sleep(self.window_ms / 1000)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            rows = [row for row, _ in batch]
+            try:
+                results = await asyncio.to_thread(self._commit, rows)
+            except Exception as exc:
+                results = [exc] * len(rows)
+            self.batches += 1
+            self.rows += len(rows)
+            # Futures are resolved on the loop, never from the worker thread
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _commit(self, rows: list[dict]) -> list:
+        try:
+            with self.session_factory() as session:
+                ids = upsert_attendance_logs(session, rows)
+                session.commit()
+            return ids
+        except IntegrityError:
+            pass
+        # One conflicting row (a reused Idempotency-Key) must not fail the
+        # rest of its batch, so retry them one transaction each
+        results = []
+        for row in rows:
+            try:
+                with self.session_factory() as session:
+                    [log_id] = upsert_attendance_logs(session, [row])
+                    session.commit()
+                results.append(log_id)
+            except IntegrityError as exc:
+                results.append(exc)
+        return results
+
+
+attendance_write_queue = AttendanceWriteQueue(
+    window_ms=settings.write_batch_window_ms,
+    max_batch=settings.write_batch_max_size,
+    max_pending=settings.write_queue_max_size,
+)